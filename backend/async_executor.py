@@ -0,0 +1,256 @@
+"""
+Program execution for the async endpoints.
+
+AsyncExecutor runs programs exactly like Executor (same pipes, limits,
+bounded output capture and RunResult) but waits on the event loop instead
+of blocking a thread: stdin/stdout/stderr are pumped with
+loop.add_writer/add_reader and the exit is noticed through a pidfd (or by
+polling), after which the child is reaped with wait4 so its resource usage
+is still known. A shared semaphore bounds how many programs run at once,
+however many requests are waiting. Result cache lookups, compiling into
+the bytecode cache and reading profile reports touch the disk and run in
+short-lived worker threads, so the loop never waits on them.
+
+Where the event loop cannot watch pipes (Windows) or the fork server is in
+use, the blocking Executor.run is called in a worker thread instead.
+"""
+import asyncio
+import os
+import select
+import subprocess
+import sys
+import time
+from typing import Optional, Tuple
+
+import anyio.to_thread
+
+from executor import DEFAULT_CAPTURE_BYTES, DEFAULT_OUTPUT_LIMIT, Executor, OutputCapture, RunResult, encode_input, read_profile, record_execution
+from sandbox import rusage_values
+import metrics
+import tracing
+
+
+def is_supported() -> bool:
+    return sys.platform != "win32" and hasattr(os, "wait4")
+
+
+async def communicate_async(
+    stdin_fd: int,
+    stdout_fd: int,
+    stderr_fd: int,
+    input_data: bytes,
+    timeout: float,
+    capture_bytes: int = DEFAULT_CAPTURE_BYTES,
+    output_limit: int = DEFAULT_OUTPUT_LIMIT,
+) -> Tuple[bytes, bytes, bool, bool]:
+    """
+    communicate_fds on the running event loop: same arguments, ownership of
+    the descriptors and return value (stdout, stderr, is_timeout, output_limited).
+    """
+    loop = asyncio.get_running_loop()
+    finished = loop.create_future()
+    captures = {stdout_fd: OutputCapture(capture_bytes), stderr_fd: OutputCapture(capture_bytes)}
+    open_fds = {stdin_fd, stdout_fd, stderr_fd}
+    state = {"offset": 0, "produced": 0, "limited": False}
+
+    def close(fd: int, writer: bool = False):
+        if writer:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+        open_fds.discard(fd)
+        os.close(fd)
+        if stdout_fd not in open_fds and stderr_fd not in open_fds and not finished.done():
+            finished.set_result(None)
+
+    def write_input():
+        offset = state["offset"]
+        try:
+            offset += os.write(stdin_fd, input_data[offset:offset + 65536])
+        except BlockingIOError:
+            return
+        except BrokenPipeError:
+            # The program exited without reading all of its input
+            offset = len(input_data)
+        state["offset"] = offset
+        if offset >= len(input_data):
+            close(stdin_fd, writer=True)
+
+    def read_output(fd: int):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        if not data:
+            close(fd)
+            return
+        captures[fd].write(data)
+        state["produced"] += len(data)
+        if state["produced"] > output_limit and not finished.done():
+            state["limited"] = True
+            finished.set_result(None)
+
+    for fd in open_fds:
+        os.set_blocking(fd, False)
+    if input_data:
+        loop.add_writer(stdin_fd, write_input)
+    else:
+        open_fds.discard(stdin_fd)
+        os.close(stdin_fd)
+    loop.add_reader(stdout_fd, read_output, stdout_fd)
+    loop.add_reader(stderr_fd, read_output, stderr_fd)
+
+    is_timeout = False
+    try:
+        await asyncio.wait_for(asyncio.shield(finished), timeout)
+    except asyncio.TimeoutError:
+        is_timeout = True
+    finally:
+        for fd in list(open_fds):
+            close(fd, writer=fd == stdin_fd)
+
+    return captures[stdout_fd].getvalue(), captures[stderr_fd].getvalue(), is_timeout, state["limited"]
+
+
+async def _wait_exit_async(pid: int, deadline: float) -> bool:
+    # _wait_exit without blocking the loop: True once pid has exited
+    # (still unreaped), False at the deadline
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+        loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+        try:
+            await asyncio.wait_for(exited, max(0.0, deadline - time.monotonic()))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(pidfd)
+            os.close(pidfd)
+
+    delay = 0.0005
+    while time.monotonic() < deadline:
+        info = os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+        if info is not None and info.si_pid:
+            return True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return False
+
+
+class AsyncExecutor:
+    """
+    Async counterpart of an Executor, sharing its timeout, limits and
+    result cache. Programs run only while holding one of slots;
+    blocking fallbacks run in threads bounded by limiter.
+    """
+
+    def __init__(self, executor: Executor, slots: asyncio.Semaphore, limiter: Optional[anyio.CapacityLimiter] = None):
+        self.executor = executor
+        self.slots = slots
+        self.limiter = limiter
+
+    async def run(self, filepath: str, input_data: str, use_cache: bool = True, profile: Optional[dict] = None) -> RunResult:
+        """Same contract as Executor.run."""
+        with tracing.span("AsyncExecutor.run", file=os.path.basename(filepath)) as span:
+            executor = self.executor
+            key = None
+            if executor.cache is not None and use_cache:
+                with tracing.span("cache_lookup"):
+                    # Hashing the source and SQLite are disk I/O: kept off the event loop
+                    key, result = await anyio.to_thread.run_sync(self._cache_lookup, filepath, input_data, profile)
+                if result is not None:
+                    span.set(cached=True)
+                    metrics.EXECUTIONS.inc(outcome="cached")
+                    return result
+
+            with tracing.span("wait_for_slot"):
+                await self.slots.acquire()
+            try:
+                if is_supported() and (executor.fork_server is None or profile is not None):
+                    with metrics.ACTIVE_PROCESSES.track():
+                        result = await self._execute(filepath, input_data, profile)
+                    record_execution(result)
+                else:
+                    result = await anyio.to_thread.run_sync(
+                        lambda: executor.run(filepath, input_data, use_cache=False, profile=profile), limiter=self.limiter
+                    )
+            finally:
+                self.slots.release()
+            if key is not None:
+                with tracing.span("cache_store"):
+                    await anyio.to_thread.run_sync(executor.cache.put, key, filepath, result)
+            return result
+
+    def _cache_lookup(self, filepath: str, input_data: str, profile: Optional[dict]) -> Tuple[str, Optional[RunResult]]:
+        cache = self.executor.cache
+        key = cache.make_key(filepath, input_data, self.executor.cache_settings(profile))
+        return key, cache.get(key)
+
+    async def _execute(self, filepath: str, input_data: str, profile: Optional[dict] = None) -> RunResult:
+        executor = self.executor
+        deadline = time.monotonic() + executor.timeout
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        # May compile the file into the bytecode cache
+        args, report_path = await anyio.to_thread.run_sync(executor.program_args, filepath, profile)
+        spawn_start = time.perf_counter()
+        with tracing.span("spawn"):
+            try:
+                process = subprocess.Popen(
+                    args,
+                    stdin=stdin_r,
+                    stdout=stdout_w,
+                    stderr=stderr_w,
+                    cwd=os.path.dirname(filepath),
+                    env=executor.program_env(),
+                )
+            except Exception as e:
+                for fd in (stdin_w, stdout_r, stderr_r):
+                    os.close(fd)
+                if report_path is not None:
+                    read_profile(report_path)
+                return RunResult("", str(e), 0.0, False)
+            finally:
+                for fd in (stdin_r, stdout_w, stderr_w):
+                    os.close(fd)
+
+        start_time = time.perf_counter()
+        metrics.SPAWN_SECONDS.observe(start_time - spawn_start, method="popen")
+        try:
+            with tracing.span("communicate"):
+                stdout, stderr, is_timeout, output_limited = await communicate_async(
+                    stdin_w, stdout_r, stderr_r, encode_input(input_data), executor.timeout,
+                    executor.capture_bytes, executor.output_limit
+                )
+            if is_timeout or output_limited:
+                process.kill()
+            # The program may close its pipes and keep running
+            with tracing.span("wait"):
+                exited = await _wait_exit_async(process.pid, deadline)
+        except BaseException:
+            # Cancelled (e.g. the client went away): never leave the program behind
+            process.kill()
+            os.wait4(process.pid, 0)
+            if report_path is not None:
+                read_profile(report_path)
+            raise
+        if not exited:
+            process.kill()
+        # Returns at once: the program has exited or was just killed
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        execution_time = time.perf_counter() - start_time
+        with tracing.span("decode_output"):
+            result = executor.make_result(
+                stdout, stderr, execution_time, is_timeout or not exited, output_limited,
+                process.returncode, rusage_values(usage)
+            )
+        if report_path is not None:
+            result = result._replace(profile=await anyio.to_thread.run_sync(read_profile, report_path))
+        return result
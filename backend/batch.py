@@ -0,0 +1,314 @@
+import hashlib
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from executor import Executor
+from benchmark import ReferenceTimings, run_benchmark
+from bytecode_cache import preflight
+from comparators import compare
+import metrics
+import tracing
+
+
+def default_worker_count() -> int:
+    return os.cpu_count() or 1
+
+
+def summarize(results: List[dict]) -> dict:
+    """Totals of per-test results: wall time, CPU time and the peak RSS."""
+    cpu_times = [r["cpu_time"] for r in results if r.get("cpu_time") is not None]
+    rss = [r["max_rss"] for r in results if r.get("max_rss") is not None]
+    return {
+        "execution_time": sum(r["execution_time"] for r in results),
+        "cpu_time": sum(cpu_times) if cpu_times else None,
+        "max_rss": max(rss) if rss else None,
+    }
+
+
+def grade_test_case(executor: Executor, filepath: str, index: int, tc: dict) -> dict:
+    """
+    Runs a single test case (a dict loaded from grading_config.json) and
+    returns the per-test result entry used in the batch response. A failed
+    test only carries a summary of its first mismatching line; the full
+    diff is built on demand (GET /api/results/{id}/diff).
+    """
+    input_data = tc.get("input_data", "")
+    expected_output = tc.get("expected_output", "")
+    run_only = tc.get("run_only", False)
+
+    run = executor.run(filepath, input_data)
+
+    status = "PASS"
+    mismatch = None
+    if run.is_timeout:
+        status = "TIMEOUT"
+    elif run.limit:
+        status = run.limit
+    elif run.stderr:
+        status = "ERROR"
+    elif not run_only:
+        mismatch = compare(expected_output, run.stdout, tc.get("comparator"))
+        if mismatch is not None:
+            status = "FAIL"
+
+    return {
+        "test_case": index + 1,
+        "status": status,
+        "execution_time": run.execution_time,
+        "cpu_time": run.cpu_time,
+        "user_time": run.user_time,
+        "sys_time": run.sys_time,
+        "max_rss": run.max_rss,
+        "output": run.stdout,
+        "error": run.stderr,
+        "diff": None,
+        "mismatch": mismatch
+    }
+
+
+def shared_result(result: dict, index: int, tc: dict) -> dict:
+    """
+    The result of another test whose run was identical (same program and
+    input), judged against this test's expected output and comparator.
+    """
+    shared = dict(result, test_case=index + 1)
+    # Other statuses come from the run itself, not from the expected output
+    if result["status"] in ("PASS", "FAIL"):
+        mismatch = None
+        if not tc.get("run_only", False):
+            mismatch = compare(tc.get("expected_output", ""), result["output"], tc.get("comparator"))
+        shared["status"] = "FAIL" if mismatch is not None else "PASS"
+        shared["mismatch"] = mismatch
+    return shared
+
+
+def not_run_result(index: int, status: str, error: str = "") -> dict:
+    # Result of a test that was never executed
+    return {
+        "test_case": index + 1,
+        "status": status,
+        "execution_time": 0.0,
+        "cpu_time": None,
+        "user_time": None,
+        "sys_time": None,
+        "max_rss": None,
+        "output": "",
+        "error": error,
+        "diff": None,
+        "mismatch": None
+    }
+
+
+def cancelled_result(index: int) -> dict:
+    return not_run_result(index, "CANCELLED")
+
+
+def benchmark_test_case(executor: Executor, filepath: str, tc: dict, result: dict, references: ReferenceTimings):
+    """Adds the repeated-run timings of a passed test to result (see benchmark.py)."""
+    status, details = run_benchmark(executor, filepath, tc.get("input_data", ""), tc["benchmark"], references)
+    result["status"] = status
+    result["benchmark"] = details
+
+
+class BatchRunner:
+    """
+    Grades many files at once. Every (file, test case) pair is an independent
+    task on a bounded thread pool; the threads mostly sit in communicate(),
+    so they overlap the waiting on child processes. Results are reassembled
+    in request order, so the response is the same as a sequential run.
+
+    on_result(filename, result) is called as soon as each test finishes
+    (in completion order), and setting cancel_event makes tests that have
+    not started yet report CANCELLED instead of running.
+
+    Test cases with a "benchmark" setting are timed after the parallel
+    pass, one at a time, so concurrent tests don't skew the measurements.
+
+    All files are compiled first, in parallel (bytecode_cache.preflight);
+    the tests of a file with a syntax error report COMPILE_ERROR without
+    running, and with the executor's bytecode cache the others run from
+    the code compiled there.
+
+    With dedupe, tasks that would run the same program (by content, in the
+    same directory) on the same input are executed once, and the run is
+    judged separately for each of them; copied submissions and common
+    tests shared between identical files cost one execution.
+    """
+
+    def __init__(self, work_dir: str, executor: Executor, max_workers: Optional[int] = None, dedupe: bool = True):
+        self.work_dir = work_dir
+        self.executor = executor
+        self.max_workers = max(1, max_workers or default_worker_count())
+        self.dedupe = dedupe
+
+    def _group_duplicates(self, tasks: List[tuple]) -> Dict[tuple, List[tuple]]:
+        # (slot, position) of the task to run -> all tasks sharing its run
+        source_hashes: Dict[str, Optional[str]] = {}
+        groups: Dict[tuple, List[tuple]] = {}
+        for task in tasks:
+            _, _, i, filepath, tc = task
+            if filepath not in source_hashes:
+                try:
+                    with open(filepath, "rb") as f:
+                        source_hashes[filepath] = hashlib.sha256(f.read()).hexdigest()
+                except OSError:
+                    source_hashes[filepath] = None
+            source_hash = source_hashes[filepath]
+            if source_hash is None:
+                key = task[:2]
+            else:
+                key = (source_hash, os.path.dirname(filepath), tc.get("input_data", ""))
+            groups.setdefault(key, []).append(task)
+        return {group[0][:2]: group for group in groups.values()}
+
+    def execute(self, tasks: List[tuple], cancel_event: Optional[threading.Event] = None) -> Iterator[Tuple[tuple, dict]]:
+        """
+        Grades tasks (slot, position, test index, filepath, test case) on the
+        thread pool, yielding (task, result) in completion order.
+        """
+        @tracing.bind
+        def run_task(filepath, i, tc):
+            if cancel_event is not None and cancel_event.is_set():
+                return cancelled_result(i)
+            with tracing.span("test", file=os.path.basename(filepath), test_case=i + 1):
+                return grade_test_case(self.executor, filepath, i, tc)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(run_task, filepath, i, tc): (slot, position, i, filepath, tc)
+                for slot, position, i, filepath, tc in tasks
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def run(
+        self,
+        filenames: List[str],
+        config: Dict[str, list],
+        use_common: bool = False,
+        on_result: Optional[Callable[[str, dict], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+        tests: Optional[Dict[str, List[int]]] = None,
+    ) -> dict:
+        """
+        tests optionally restricts each file to some test indices (0-based);
+        its "results" then only hold those tests, in index order.
+        """
+        start_time = time.perf_counter()
+
+        results: List[dict] = []
+        tasks = []  # (slot in results, position in its results, test index, filepath, test case)
+
+        common_tests = config.get("__COMMON__", []) if use_common else []
+
+        for filename in filenames:
+            filepath = os.path.join(self.work_dir, filename)
+            if not os.path.exists(filepath):
+                results.append({
+                    "filename": filename,
+                    "status": "NOT_FOUND",
+                    "details": "File not found"
+                })
+                continue
+
+            test_cases = common_tests if use_common else config.get(filename, [])
+            indices = range(len(test_cases))
+            if tests is not None:
+                indices = [i for i in tests.get(filename, []) if i < len(test_cases)]
+            if not test_cases:
+                results.append({
+                    "filename": filename,
+                    "status": "NO_TESTS",
+                    "details": "No test cases defined"
+                })
+                continue
+
+            slot = len(results)
+            results.append({
+                "filename": filename,
+                "results": [None] * len(indices)
+            })
+            for position, i in enumerate(indices):
+                tasks.append((slot, position, i, filepath, test_cases[i]))
+
+        filepaths = sorted({task[3] for task in tasks})
+        with tracing.span("preflight", files=len(filepaths)):
+            compiled = preflight(filepaths, self.executor.bytecode, self.max_workers)
+        runnable = []
+        for task in tasks:
+            slot, position, i, filepath, tc = task
+            error = compiled[filepath].error
+            if error is None:
+                runnable.append(task)
+                continue
+            result = not_run_result(i, "COMPILE_ERROR", error)
+            results[slot]["results"][position] = result
+            if on_result is not None:
+                on_result(results[slot]["filename"], result)
+
+        with tracing.span("dedupe", tasks=len(runnable)):
+            if self.dedupe:
+                duplicates = self._group_duplicates(runnable)
+            else:
+                duplicates = {task[:2]: [task] for task in runnable}
+        unique_tasks = [group[0] for group in duplicates.values()]
+
+        benchmarks = []  # tasks of passed tests that have a benchmark setting
+        executed_results = []  # one per execution, without the results shared from it
+        pending = len(runnable)
+        metrics.BATCH_PENDING.inc(pending)
+        with tracing.span("execute_tests", executions=len(unique_tasks)):
+            try:
+                for executed, executed_result in self.execute(unique_tasks, cancel_event):
+                    executed_results.append(executed_result)
+                    for task in duplicates[executed[:2]]:
+                        slot, position, i, filepath, tc = task
+                        result = executed_result if task is executed else shared_result(executed_result, i, tc)
+                        results[slot]["results"][position] = result
+                        pending -= 1
+                        metrics.BATCH_PENDING.dec()
+                        if tc.get("benchmark") and result["status"] == "PASS":
+                            benchmarks.append(task)
+                        elif on_result is not None:
+                            on_result(results[slot]["filename"], result)
+            finally:
+                metrics.BATCH_PENDING.dec(pending)
+
+        references = ReferenceTimings()
+        for slot, position, i, filepath, tc in sorted(benchmarks, key=lambda task: task[:2]):
+            result = results[slot]["results"][position]
+            if cancel_event is None or not cancel_event.is_set():
+                with tracing.span("benchmark", file=os.path.basename(filepath), test_case=i + 1):
+                    benchmark_test_case(self.executor, filepath, tc, result, references)
+            if on_result is not None:
+                on_result(results[slot]["filename"], result)
+
+        wall_time = time.perf_counter() - start_time
+        all_results = []
+        for entry in results:
+            if "results" in entry:
+                entry["summary"] = summarize(entry["results"])
+                all_results.extend(entry["results"])
+        for result in all_results:
+            metrics.TEST_RESULTS.inc(status=result["status"])
+        # Shared results copy the time of the run they came from; count it once
+        totals = summarize(executed_results)
+
+        return {
+            "batch_results": results,
+            "stats": {
+                "workers": self.max_workers,
+                "tasks": len(tasks),
+                "executions": len(unique_tasks),
+                "executions_saved": len(runnable) - len(unique_tasks),
+                "compile_errors": sum(1 for result in compiled.values() if result.error is not None),
+                "benchmarks": len(benchmarks),
+                "wall_time": wall_time,
+                "summed_execution_time": totals["execution_time"],
+                "cpu_time": totals["cpu_time"],
+                "speedup": totals["execution_time"] / wall_time if wall_time > 0 else 0.0
+            }
+        }
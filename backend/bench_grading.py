@@ -0,0 +1,260 @@
+"""
+Benchmarks of the grading pipeline on synthetic workspaces
+(generate_workspace.py).
+
+Each scenario generates a workspace and grades it with BatchRunner in a
+fresh process, so memory figures don't carry over between scenarios, and
+measures:
+
+- throughput: tests graded per second of batch wall time
+- latency_p50 / latency_p99: time of one Executor.run (spawn, run, capture)
+- overhead_mean / overhead_p50: that latency minus the program's own
+  execution_time, i.e. what grading adds per test
+- peak_rss: peak resident memory of the grading process
+- serialize_time / response_bytes: JSON encoding of the batch response
+
+The "mixed" scenario uses the whole mix; with per-kind scenarios every
+program kind is also measured alone. Results are written as JSON, and
+--baseline compares them to the file of an earlier version.
+
+Usage: python bench_grading.py [--submissions N] [--output FILE] [--baseline FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from batch import BatchRunner
+from executor import Executor, RunResult
+from generate_workspace import DEFAULT_MIX, PROGRAMS, generate_workspace, parse_mix
+from grading_store import GradingStore
+
+# Metrics where a larger value is better; for all others smaller is better
+HIGHER_IS_BETTER = {"throughput"}
+# Relative change reported as a regression by --baseline
+REGRESSION_THRESHOLD = 0.10
+
+
+class TimedExecutor(Executor):
+    """Executor recording the duration of every run."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.timings: List[tuple] = []  # (latency, execution_time)
+
+    def run(self, filepath: str, input_data: str, use_cache: bool = True, profile: Optional[dict] = None) -> RunResult:
+        start_time = time.perf_counter()
+        result = super().run(filepath, input_data, use_cache, profile)
+        latency = time.perf_counter() - start_time
+        with self.lock:
+            self.timings.append((latency, result.execution_time))
+        return result
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss() -> int:
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value if sys.platform == "darwin" else value * 1024
+
+
+def run_scenario(config: dict) -> dict:
+    """Generates and grades one workspace (in this process); returns its metrics."""
+    with tempfile.TemporaryDirectory(prefix="bench_grading_") as work_dir:
+        generate_workspace(
+            work_dir, config["submissions"], config["mix"], config["tests"],
+            config["stdin_bytes"], config["duplicates"], config["seed"]
+        )
+        store = GradingStore(work_dir)
+        test_cases = store.load()
+        filenames = sorted(name for name in test_cases if name != "__COMMON__")
+
+        executor = TimedExecutor(timeout=config["timeout"])
+        runner = BatchRunner(work_dir, executor, config["workers"], dedupe=config["dedupe"])
+        start_time = time.perf_counter()
+        response = runner.run(filenames, test_cases)
+        wall_time = time.perf_counter() - start_time
+
+        serialize_start = time.perf_counter()
+        body = json.dumps(response, ensure_ascii=False)
+        serialize_time = time.perf_counter() - serialize_start
+        store.close()
+
+    latencies = [latency for latency, _ in executor.timings]
+    overheads = [latency - execution_time for latency, execution_time in executor.timings]
+    statuses = Counter(
+        result["status"]
+        for entry in response["batch_results"]
+        for result in entry.get("results", [])
+    )
+    tests = response["stats"]["tasks"]
+    return {
+        "submissions": len(filenames),
+        "tests": tests,
+        "executions": len(executor.timings),
+        "workers": response["stats"]["workers"],
+        "wall_time": wall_time,
+        "throughput": tests / wall_time if wall_time > 0 else None,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p99": percentile(latencies, 0.99),
+        "overhead_mean": sum(overheads) / len(overheads) if overheads else None,
+        "overhead_p50": percentile(overheads, 0.5),
+        "peak_rss": peak_rss(),
+        "serialize_time": serialize_time,
+        "response_bytes": len(body.encode("utf-8")),
+        "statuses": dict(statuses),
+    }
+
+
+def run_in_subprocess(config: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-scenario", json.dumps(config)],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_revision() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None
+
+
+def compare_results(baseline: dict, current: dict) -> List[dict]:
+    """Changes of every numeric metric present in both result files."""
+    changes = []
+    for name, metrics in current["scenarios"].items():
+        old_metrics = baseline.get("scenarios", {}).get(name)
+        if old_metrics is None:
+            continue
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            changes.append({
+                "scenario": name,
+                "metric": metric,
+                "baseline": old,
+                "current": value,
+                "change": change,
+                "regression": worse > REGRESSION_THRESHOLD,
+            })
+    return changes
+
+
+def format_ms(value: Optional[float]) -> str:
+    # Latencies are None when no test of the scenario was executed (e.g. syntax errors)
+    return "n/a" if value is None else f"{value * 1000:.1f} ms"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the grading pipeline on synthetic workspaces.")
+    parser.add_argument("--submissions", type=int, default=100, help="submissions in the mixed scenario")
+    parser.add_argument("--kind-submissions", type=int, default=20, help="submissions in each per-kind scenario")
+    parser.add_argument("--no-per-kind", action="store_true", help="only run the mixed scenario")
+    parser.add_argument("--mix", default=None, help="kind=weight,... for the mixed scenario")
+    parser.add_argument("--tests", type=int, default=3, help="test cases per submission")
+    parser.add_argument("--stdin-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--duplicates", type=float, default=0.0, help="share of copied submissions")
+    parser.add_argument("--workers", type=int, default=None, help="batch workers (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="per-test timeout in seconds")
+    parser.add_argument("--no-dedupe", action="store_true", help="execute identical runs separately")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--run-scenario", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario is not None:
+        # Child process of run_in_subprocess
+        print(json.dumps(run_scenario(json.loads(args.run_scenario))))
+        return
+
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    base = {
+        "tests": args.tests,
+        "stdin_bytes": args.stdin_bytes,
+        "duplicates": args.duplicates,
+        "workers": args.workers,
+        "timeout": args.timeout,
+        "dedupe": not args.no_dedupe,
+        "seed": args.seed,
+    }
+    scenarios: Dict[str, dict] = {"mixed": dict(base, submissions=args.submissions, mix=mix)}
+    if not args.no_per_kind:
+        for kind in PROGRAMS:
+            scenarios[kind] = dict(base, submissions=args.kind_submissions, mix={kind: 1})
+
+    results = {
+        "revision": git_revision(),
+        "created_at": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": dict(base, submissions=args.submissions, kind_submissions=args.kind_submissions, mix=mix),
+        "scenarios": {},
+    }
+    for name, config in scenarios.items():
+        print(f"{name}: {config['submissions']} submissions ...", end=" ", flush=True)
+        metrics = run_in_subprocess(config)
+        results["scenarios"][name] = metrics
+        print(
+            f"{metrics['throughput']:.1f} tests/s, p50 {format_ms(metrics['latency_p50'])}, "
+            f"p99 {format_ms(metrics['latency_p99'])}, "
+            f"overhead {format_ms(metrics['overhead_mean'])}, "
+            f"peak {metrics['peak_rss'] / 1024 / 1024:.0f} MiB",
+            flush=True,
+        )
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            changes = compare_results(json.load(f), results)
+        results["comparison"] = {"baseline": args.baseline, "changes": changes}
+        regressions = [c for c in changes if c["regression"]]
+        print(f"\nCompared with {args.baseline}: {len(regressions)} regressions")
+        for c in regressions:
+            print(
+                f"  {c['scenario']} {c['metric']}: {format_value(c['baseline'])} -> "
+                f"{format_value(c['current'])} ({c['change']:+.0%})"
+            )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
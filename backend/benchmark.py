@@ -0,0 +1,136 @@
+import math
+import os
+import statistics
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from executor import Executor, RunResult
+
+DEFAULT_BENCHMARK = {
+    "repeats": 5,
+    "warmup": 1,
+    "reference": None,
+    "max_slowdown": 2.0,
+    "metric": "cpu_time",
+}
+
+
+def timing_stats(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    # Nearest-rank percentile
+    p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+    return {
+        "median": statistics.median(ordered),
+        "p95": p95,
+        "stddev": statistics.pstdev(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+
+
+def failure_status(run: RunResult) -> Optional[str]:
+    if run.is_timeout:
+        return "TIMEOUT"
+    if run.limit:
+        return run.limit
+    if run.stderr:
+        return "ERROR"
+    return None
+
+
+def measure(executor: Executor, filepath: str, input_data: str, repeats: int, warmup: int) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Runs filepath warmup + repeats times, bypassing the result cache, and
+    returns ({"samples", "execution_time": stats, "cpu_time": stats or None}, None),
+    or (None, status) as soon as one run does not finish cleanly.
+    """
+    wall, cpu = [], []
+    for i in range(warmup + repeats):
+        run = executor.run(filepath, input_data, use_cache=False)
+        status = failure_status(run)
+        if status is not None:
+            return None, status
+        if i >= warmup:
+            wall.append(run.execution_time)
+            cpu.append(run.cpu_time)
+    return {
+        "samples": len(wall),
+        "execution_time": timing_stats(wall),
+        "cpu_time": timing_stats(cpu) if None not in cpu else None,
+    }, None
+
+
+class ReferenceTimings:
+    """
+    Measurements of reference solutions, so a reference is timed once per
+    input while many submissions are compared against it. Keyed by the
+    file's mtime and size, so editing the reference re-measures it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key_locks: Dict[tuple, threading.Lock] = {}
+        self.measurements: Dict[tuple, Tuple[Optional[dict], Optional[str]]] = {}
+
+    def get(self, executor: Executor, filepath: str, input_data: str, repeats: int, warmup: int):
+        stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime_ns, stat.st_size, input_data, repeats, warmup)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self.measurements:
+                self.measurements[key] = measure(executor, filepath, input_data, repeats, warmup)
+            return self.measurements[key]
+
+
+def run_benchmark(
+    executor: Executor,
+    filepath: str,
+    input_data: str,
+    config: dict,
+    references: Optional[ReferenceTimings] = None,
+) -> Tuple[str, dict]:
+    """
+    Performance grading of a test that already passed. config is the test
+    case's "benchmark" dict (see DEFAULT_BENCHMARK). The submission is
+    TOO_SLOW when its median exceeds max_slowdown times the reference's.
+    Returns: (status, benchmark details)
+    """
+    config = {**DEFAULT_BENCHMARK, **{k: v for k, v in config.items() if v is not None}}
+    repeats = max(1, int(config["repeats"]))
+    warmup = max(0, int(config["warmup"]))
+
+    timings, status = measure(executor, filepath, input_data, repeats, warmup)
+    details = {"repeats": repeats, "warmup": warmup, "timings": timings}
+    if status is not None:
+        details["error"] = f"Benchmark run ended with {status}"
+        return status, details
+
+    reference = config["reference"]
+    if not reference:
+        return "PASS", details
+    reference_path = os.path.join(os.path.dirname(filepath), reference)
+    details["reference"] = reference
+    if not os.path.exists(reference_path):
+        details["reference_error"] = "Reference file not found"
+        return "PASS", details
+
+    if references is None:
+        references = ReferenceTimings()
+    reference_timings, reference_status = references.get(executor, reference_path, input_data, repeats, warmup)
+    details["reference_timings"] = reference_timings
+    if reference_status is not None:
+        details["reference_error"] = f"Reference run ended with {reference_status}"
+        return "PASS", details
+
+    # CPU time is far less sensitive to machine load; wall time where it is unknown
+    metric = config["metric"]
+    if metric not in ("cpu_time", "execution_time") or timings[metric] is None or reference_timings[metric] is None:
+        metric = "execution_time"
+    median = timings[metric]["median"]
+    reference_median = reference_timings[metric]["median"]
+    ratio = median / reference_median if reference_median > 0 else None
+    details.update({"metric": metric, "ratio": ratio, "max_slowdown": config["max_slowdown"]})
+    if ratio is not None and ratio > config["max_slowdown"]:
+        return "TOO_SLOW", details
+    return "PASS", details
@@ -0,0 +1,146 @@
+"""
+Compile pre-flight and cached bytecode of submissions.
+
+BatchRunner compiles every file of a batch once, in parallel, before any
+test runs (preflight()). A file that does not compile gets COMPILE_ERROR
+for all of its tests without being executed. Otherwise the compiled code
+is stored in the cache directory (never next to the student's file),
+keyed by the file's path and a hash of its source, and the executor runs
+it through bytecode_runner.py instead of "python FILE", so the source is
+not parsed and compiled again for every test.
+
+compile() is mostly CPU work under the GIL, so the parallel pre-flight
+chiefly overlaps reading, hashing and writing files; each source is only
+compiled once per change anyway.
+"""
+import hashlib
+import marshal
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+# Compiled files kept in the cache directory; the oldest are removed beyond this
+MAX_ENTRIES = 10000
+
+
+class CompileResult(NamedTuple):
+    bytecode_path: Optional[str]  # None if not compiled (see error) or not cached
+    error: Optional[str] = None  # the error python would print, if the file doesn't compile
+
+
+def compile_error(e: Exception, filepath: str) -> str:
+    # The error as "python FILE" reports it; compile() words some errors
+    # differently (e.g. null bytes) and gives them no location
+    if not isinstance(e, SyntaxError) or e.filename is None:
+        message = e.msg if isinstance(e, SyntaxError) else str(e)
+        e = SyntaxError(message.replace("source code string", "source code"), (filepath, 1, None, None))
+    return "".join(traceback.format_exception_only(type(e), e))
+
+
+def compile_source(source: bytes, filepath: str):
+    # Same flags as the interpreter compiling FILE for "python FILE"
+    return compile(source, filepath, "exec", dont_inherit=True, optimize=0)
+
+
+def check_source(filepath: str) -> CompileResult:
+    """Compiles filepath without caching anything."""
+    try:
+        with open(filepath, "rb") as f:
+            compile_source(f.read(), filepath)
+    except OSError:
+        pass  # left to the run to report
+    except (SyntaxError, ValueError) as e:
+        return CompileResult(None, compile_error(e, filepath))
+    return CompileResult(None)
+
+
+class BytecodeCache:
+    def __init__(self, directory: str, max_entries: int = MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.tag = sys.implementation.cache_tag or "python"
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # filepath -> ((mtime_ns, size), CompileResult) so unchanged files aren't read again
+        self.compiled: Dict[str, tuple] = {}
+
+    def compile(self, filepath: str) -> CompileResult:
+        """Cached bytecode of filepath, compiling it when it changed."""
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return CompileResult(None)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.compiled.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        try:
+            with open(filepath, "rb") as f:
+                source = f.read()
+        except OSError:
+            return CompileResult(None)
+        # The path is part of the key: tracebacks show the file the code was compiled for
+        digest = hashlib.sha256(filepath.encode("utf-8") + b"\0" + source).hexdigest()
+        path = os.path.join(self.directory, f"{digest}.{self.tag}.code")
+        if os.path.exists(path):
+            result = CompileResult(path)
+        else:
+            try:
+                code = compile_source(source, filepath)
+            except (SyntaxError, ValueError) as e:
+                result = CompileResult(None, compile_error(e, filepath))
+            else:
+                result = CompileResult(self._write(path, code))
+
+        with self.lock:
+            self.compiled[filepath] = (signature, result)
+        return result
+
+    def _write(self, path: str, code) -> Optional[str]:
+        # Written under a temporary name first so runs never see a partial file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        return path
+
+    def prune(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".code")]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        with self.lock:
+            self.compiled.clear()
+
+
+def preflight(filepaths: List[str], cache: Optional[BytecodeCache] = None, max_workers: Optional[int] = None) -> Dict[str, CompileResult]:
+    """
+    Compiles filepaths in parallel (into cache, if given).
+    Returns filepath -> CompileResult.
+    """
+    check = cache.compile if cache is not None else check_source
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(filepaths, pool.map(check, filepaths)))
+    if cache is not None:
+        cache.prune()
+    return results
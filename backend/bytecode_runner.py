@@ -0,0 +1,68 @@
+"""
+Runs a submission from bytecode compiled ahead of time (bytecode_cache.py):
+
+    python bytecode_runner.py CODE_PATH SCRIPT
+
+behaves like "python SCRIPT" (the same __main__, sys.argv, sys.path[0],
+tracebacks and exit status) without compiling SCRIPT again. Should
+CODE_PATH be empty, missing or unreadable, SCRIPT is compiled as usual.
+
+The executor also starts programs through here when they run under
+resource limits: the limits in PROGRAM_CHECKER_LIMITS are applied before
+the program runs (see sandbox.py).
+
+Kept small and free of non-builtin imports: this file itself is compiled
+on every start, and must not shadow the submission's modules.
+"""
+import marshal
+import os
+import sys
+
+
+def apply_limits():
+    if os.environ.get("PROGRAM_CHECKER_LIMITS"):
+        import sandbox
+        sandbox.apply_env_limits()
+        # The submission may have a sandbox.py of its own
+        del sys.modules["sandbox"]
+
+
+def main():
+    apply_limits()
+    code_path, script = sys.argv[1], sys.argv[2]
+    sys.argv = sys.argv[2:]
+    sys.path[0] = os.path.dirname(script)
+
+    code = None
+    if code_path:
+        try:
+            with open(code_path, "rb") as f:
+                code = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    if code is None:
+        with open(script, "rb") as f:
+            source = f.read()
+        try:
+            code = compile(source, script, "exec", dont_inherit=True)
+        except (SyntaxError, ValueError):
+            # Let python itself report the error, exactly as for "python SCRIPT"
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    module = type(sys)("__main__")
+    module.__file__ = script
+    module.__builtins__ = __builtins__
+    sys.modules["__main__"] = module
+    try:
+        exec(code, module.__dict__)
+    except SystemExit:
+        raise
+    except BaseException as e:
+        # The traceback starts at the submission's code, as without this runner
+        e = e.with_traceback(e.__traceback__.tb_next)
+        sys.excepthook(type(e), e, e.__traceback__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
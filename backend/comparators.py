@@ -0,0 +1,254 @@
+"""
+Output comparators, selected per test case by its "comparator" setting:
+
+- exact: the whole output after stripping surrounding whitespace, line by
+  line (CRLF and LF are equal). The default, and the behaviour before
+  comparators existed.
+- tokens: whitespace-separated tokens, ignoring how they are laid out
+- float: tokens, where two numbers are equal within abs_tol / rel_tol
+- regex: expected_output (stripped) is a regular expression that must
+  match the whole stripped output
+- unordered_lines: the same lines in any order
+
+Comparators stop at the first mismatch instead of building normalized
+copies of both outputs: exact comparison scans the stripped outputs in
+large chunks (copying only when CRLF has to be normalized), and the token
+comparators walk the outputs token by token after the same quick
+identity check. They return None when the outputs match, otherwise a
+mismatch summary {"line", "expected", "actual"} (plus "detail" where
+useful).
+"""
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from diffing import MAX_SUMMARY_CHARS
+import metrics
+import tracing
+
+DEFAULT_ABS_TOL = 1e-6
+DEFAULT_REL_TOL = 1e-6
+
+_NON_SPACE = re.compile(r"\S")
+_TOKEN = re.compile(r"\S+")
+
+
+def _clip(text: Optional[str]) -> Optional[str]:
+    if text is not None and len(text) > MAX_SUMMARY_CHARS:
+        return text[:MAX_SUMMARY_CHARS] + "..."
+    return text
+
+
+def _bounds(text: str) -> Tuple[int, int]:
+    # (start, end) of text.strip() without copying it
+    match = _NON_SPACE.search(text)
+    if match is None:
+        return 0, 0
+    end = len(text)
+    while text[end - 1].isspace():
+        end -= 1
+    return match.start(), end
+
+
+def iter_lines(text: str) -> Iterator[str]:
+    """Lines of text.strip() with CRLF treated as LF, produced one at a time."""
+    pos, end = _bounds(text)
+    while pos < end:
+        newline = text.find("\n", pos, end)
+        if newline == -1:
+            newline = end
+        line_end = newline
+        if line_end > pos and text[line_end - 1] == "\r":
+            line_end -= 1
+        yield text[pos:line_end]
+        pos = newline + 1
+
+
+def _mismatch(line: int, expected: Optional[str], actual: Optional[str], detail: Optional[str] = None) -> dict:
+    mismatch = {"line": line, "expected": _clip(expected), "actual": _clip(actual)}
+    if detail is not None:
+        mismatch["detail"] = detail
+    return mismatch
+
+
+# Characters compared per step while looking for the first difference
+_CHUNK = 64 * 1024
+
+
+def _region(text: str) -> Tuple[str, int, int]:
+    # (text, start, end) of the normalized output; only copied when CRLF is present
+    if "\r" in text:
+        text = text.strip().replace("\r\n", "\n")
+        return text, 0, len(text)
+    start, end = _bounds(text)
+    return text, start, end
+
+
+def _first_difference(a: str, a_start: int, a_end: int, b: str, b_start: int, b_end: int) -> Optional[int]:
+    # Offset of the first differing character of two regions, None if equal
+    length = min(a_end - a_start, b_end - b_start)
+    offset = 0
+    while offset < length:
+        size = min(_CHUNK, length - offset)
+        if a.startswith(b[b_start + offset:b_start + offset + size], a_start + offset, a_start + offset + size):
+            offset += size
+            continue
+        while a[a_start + offset] == b[b_start + offset]:
+            offset += 1
+        return offset
+    return None if a_end - a_start == b_end - b_start else length
+
+
+def _line_at(text: str, start: int, end: int, pos: int) -> Optional[str]:
+    # The line containing pos within [start, end), None past the end
+    if start == end or pos > end or (pos == end and text[pos - 1] == "\n"):
+        return None
+    line_start = text.rfind("\n", start, pos) + 1 or start
+    line_end = text.find("\n", pos, end)
+    return text[max(line_start, start):end if line_end == -1 else line_end]
+
+
+def compare_exact(expected: str, actual: str) -> Optional[dict]:
+    e_text, e_start, e_end = _region(expected)
+    a_text, a_start, a_end = _region(actual)
+    offset = _first_difference(e_text, e_start, e_end, a_text, a_start, a_end)
+    if offset is None:
+        return None
+    line = e_text.count("\n", e_start, e_start + offset) + 1
+    e_pos, a_pos = e_start + offset, a_start + offset
+    e_line = _line_at(e_text, e_start, e_end, e_pos)
+    a_line = _line_at(a_text, a_start, a_end, a_pos)
+    if e_line == a_line:
+        # One output just has more lines; the difference starts on the next one
+        line += 1
+        e_line = _line_at(e_text, e_start, e_end, e_pos + 1)
+        a_line = _line_at(a_text, a_start, a_end, a_pos + 1)
+    return _mismatch(line, e_line, a_line)
+
+
+def _identical(expected: str, actual: str) -> bool:
+    # Cheap check run before the comparators that look at every token or line
+    e_text, e_start, e_end = _region(expected)
+    a_text, a_start, a_end = _region(actual)
+    return _first_difference(e_text, e_start, e_end, a_text, a_start, a_end) is None
+
+
+def _line_of(text: str, pos: int) -> int:
+    return text.count("\n", 0, pos) + 1
+
+
+def _compare_token_streams(expected: str, actual: str, equal) -> Optional[dict]:
+    expected_tokens = _TOKEN.finditer(expected)
+    actual_tokens = _TOKEN.finditer(actual)
+    index = 0
+    while True:
+        index += 1
+        e = next(expected_tokens, None)
+        a = next(actual_tokens, None)
+        if e is None and a is None:
+            return None
+        if e is None or a is None or not equal(e.group(), a.group()):
+            line = _line_of(actual, a.start()) if a is not None else _line_of(actual, len(actual))
+            return _mismatch(
+                line,
+                e.group() if e is not None else None,
+                a.group() if a is not None else None,
+                f"token {index}",
+            )
+
+
+def compare_tokens(expected: str, actual: str) -> Optional[dict]:
+    if _identical(expected, actual):
+        return None
+    return _compare_token_streams(expected, actual, str.__eq__)
+
+
+def _parse_float(token: str) -> Optional[float]:
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def compare_float(expected: str, actual: str, abs_tol: float = DEFAULT_ABS_TOL, rel_tol: float = DEFAULT_REL_TOL) -> Optional[dict]:
+    def equal(e: str, a: str) -> bool:
+        if e == a:
+            return True
+        e_value, a_value = _parse_float(e), _parse_float(a)
+        if e_value is None or a_value is None:
+            return False
+        return math.isclose(e_value, a_value, rel_tol=rel_tol, abs_tol=abs_tol)
+
+    if _identical(expected, actual):
+        return None
+    return _compare_token_streams(expected, actual, equal)
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str):
+    return re.compile(pattern)
+
+
+def compare_regex(expected: str, actual: str) -> Optional[dict]:
+    pattern_start, pattern_end = _bounds(expected)
+    try:
+        pattern = _compile(expected[pattern_start:pattern_end])
+    except re.error as e:
+        return _mismatch(1, expected, None, f"invalid regular expression: {e}")
+    start, end = _bounds(actual)
+    if pattern.fullmatch(actual, start, end):
+        return None
+    first_line = next(iter_lines(actual), None)
+    return _mismatch(1, pattern.pattern, first_line, "output does not match the regular expression")
+
+
+def compare_unordered_lines(expected: str, actual: str) -> Optional[dict]:
+    if _identical(expected, actual):
+        return None
+    remaining = Counter(iter_lines(expected))
+    line = 0
+    for line, a in enumerate(iter_lines(actual), 1):
+        if remaining[a] <= 0:
+            return _mismatch(line, None, a, "unexpected line")
+        remaining[a] -= 1
+    missing = next((e for e, count in remaining.items() if count > 0), None)
+    if missing is not None:
+        return _mismatch(line + 1, missing, None, "missing line")
+    return None
+
+
+def _float_comparator(expected: str, actual: str, config: dict) -> Optional[dict]:
+    abs_tol = config.get("abs_tol")
+    rel_tol = config.get("rel_tol")
+    return compare_float(
+        expected, actual,
+        abs_tol=DEFAULT_ABS_TOL if abs_tol is None else abs_tol,
+        rel_tol=DEFAULT_REL_TOL if rel_tol is None else rel_tol,
+    )
+
+
+# name -> comparator(expected, actual, config); register new ones here
+COMPARATORS: Dict[str, Callable[[str, str, dict], Optional[dict]]] = {
+    "exact": lambda expected, actual, config: compare_exact(expected, actual),
+    "tokens": lambda expected, actual, config: compare_tokens(expected, actual),
+    "float": _float_comparator,
+    "regex": lambda expected, actual, config: compare_regex(expected, actual),
+    "unordered_lines": lambda expected, actual, config: compare_unordered_lines(expected, actual),
+}
+
+
+def compare(expected: str, actual: str, config: Optional[dict] = None) -> Optional[dict]:
+    """
+    Compares actual output against expected_output with the comparator
+    config of a test case ({"type", "abs_tol", "rel_tol"}; None means exact).
+    Returns None on a match, otherwise the first mismatch.
+    """
+    config = config or {}
+    kind = config.get("type") or "exact"
+    if kind not in COMPARATORS:
+        raise ValueError(f"Unknown comparator: {kind}")
+    with metrics.COMPARE_SECONDS.time(comparator=kind), tracing.span("compare", comparator=kind):
+        return COMPARATORS[kind](expected, actual, config)
@@ -0,0 +1,139 @@
+"""
+Diffs between expected and actual output, built only when asked for.
+
+Grading only needs to know whether (and where) two outputs differ, which
+the comparators answer in one pass. make_diff() builds the full unified
+diff but keeps the cost bounded for large outputs: the common
+prefix and suffix are trimmed with plain line comparisons first, and
+difflib (quadratic in the worst case) only ever sees a capped window of
+the differing middle part.
+"""
+import difflib
+from typing import List
+
+import metrics
+import tracing
+
+# Differing lines (per side) handed to difflib; the rest is reported as truncated
+MAX_DIFF_INPUT_LINES = 2000
+# Lines of unified diff output returned
+MAX_DIFF_OUTPUT_LINES = 1000
+# Characters of a line quoted in a mismatch summary
+MAX_SUMMARY_CHARS = 200
+
+
+def normalize_output(text: str) -> str:
+    return text.strip().replace("\r\n", "\n")
+
+
+def _common_prefix(a: List[str], b: List[str]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def _common_suffix(a: List[str], b: List[str], limit: int) -> int:
+    n = 0
+    while n < limit and a[-1 - n] == b[-1 - n]:
+        n += 1
+    return n
+
+
+def _hunk_range(start: int, length: int) -> str:
+    # Same format as difflib.unified_diff
+    first = start + 1
+    if length == 1:
+        return str(first)
+    if not length:
+        first -= 1
+    return f"{first},{length}"
+
+
+def _group_opcodes(codes: list, n: int) -> list:
+    # SequenceMatcher.get_grouped_opcodes() for an arbitrary opcode list
+    codes = [code for code in codes if code[1] != code[2] or code[3] != code[4]]
+    if not codes:
+        return []
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    groups, group = [], []
+    for tag, i1, i2, j1, j2 in codes:
+        # End the current group and start a new one at a long equal run
+        if tag == "equal" and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        groups.append(group)
+    return groups
+
+
+@metrics.DIFF_SECONDS.time()
+def make_diff(expected: str, actual: str, context: int = 3, max_lines: int = MAX_DIFF_OUTPUT_LINES) -> dict:
+    """
+    Unified diff (Expected -> Actual) of the normalized outputs.
+    Returns {"diff": str or None when equal, "truncated": bool}.
+    """
+    with tracing.span("diff"):
+        return _make_diff(expected, actual, context, max_lines)
+
+
+def _make_diff(expected: str, actual: str, context: int, max_lines: int) -> dict:
+    with tracing.span("normalize"):
+        a = normalize_output(expected).splitlines()
+        b = normalize_output(actual).splitlines()
+    prefix = _common_prefix(a, b)
+    suffix = _common_suffix(a, b, min(len(a), len(b)) - prefix)
+    if prefix == len(a) == len(b):
+        return {"diff": None, "truncated": False}
+
+    # difflib only sees the differing middle, capped; prefix and suffix are equal runs
+    a_end = len(a) - suffix
+    b_end = len(b) - suffix
+    truncated = False
+    if a_end - prefix > MAX_DIFF_INPUT_LINES or b_end - prefix > MAX_DIFF_INPUT_LINES:
+        a_end = min(a_end, prefix + MAX_DIFF_INPUT_LINES)
+        b_end = min(b_end, prefix + MAX_DIFF_INPUT_LINES)
+        truncated = True
+    with tracing.span("difflib", lines=max(a_end, b_end) - prefix):
+        matcher = difflib.SequenceMatcher(None, a[prefix:a_end], b[prefix:b_end])
+        codes = [("equal", 0, prefix, 0, prefix)]
+        codes += [
+            (tag, prefix + i1, prefix + i2, prefix + j1, prefix + j2)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        ]
+    if not truncated:
+        codes.append(("equal", a_end, len(a), b_end, len(b)))
+
+    lines = ["--- Expected", "+++ Actual"]
+    for group in _group_opcodes(codes, context):
+        first, last = group[0], group[-1]
+        lines.append(
+            f"@@ -{_hunk_range(first[1], last[2] - first[1])}"
+            f" +{_hunk_range(first[3], last[4] - first[3])} @@"
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines.extend(" " + line for line in a[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                lines.extend("-" + line for line in a[i1:i2])
+            if tag in ("replace", "insert"):
+                lines.extend("+" + line for line in b[j1:j2])
+        if len(lines) > max_lines:
+            truncated = True
+            break
+
+    lines = lines[:max_lines]
+    if truncated:
+        lines.append("... (diff truncated)")
+    return {"diff": "\n".join(lines), "truncated": truncated}
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Directories never descended into
+SKIPPED_DIRS = {"__pycache__", "node_modules"}
+MAX_DEPTH = 8
+
+
+class FileInfo(NamedTuple):
+    size: int
+    mtime: float
+    mtime_ns: int
+
+
+class DirectoryIndex:
+    """
+    In-memory listing of the files under a work directory, so /api/files
+    does not hit the file system on every call.
+
+    The tree is rescanned at most once per ttl seconds (or when forced);
+    a rescan only re-lists directories whose mtime changed and only stats
+    the files in the rest. Paths are relative to the root with "/" as the
+    separator. Content hashes are computed on request and kept until the
+    file's size or mtime changes. Hidden entries are skipped.
+    """
+
+    def __init__(self, root: str, ttl: float = 2.0):
+        self.root = root
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # relative dir -> (dir mtime_ns, file names, subdirectory names)
+        self.dirs: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        self.files: Dict[str, FileInfo] = {}
+        self.hashes: Dict[str, Tuple[FileInfo, str]] = {}
+        self.recursive = False
+        self.refreshed_at = 0.0
+        self.sorted_names: Optional[List[str]] = None
+
+    def _abs(self, rel: str) -> str:
+        return os.path.join(self.root, *rel.split("/")) if rel else self.root
+
+    def _list_dir(self, rel: str, mtime_ns: int) -> Tuple[int, List[str], List[str]]:
+        cached = self.dirs.get(rel)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached
+        names, subdirs = [], []
+        with os.scandir(self._abs(rel)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIPPED_DIRS:
+                        subdirs.append(entry.name)
+                elif entry.is_file():
+                    names.append(entry.name)
+        listing = (mtime_ns, names, subdirs)
+        self.dirs[rel] = listing
+        return listing
+
+    def refresh(self, recursive: bool = False, force: bool = False):
+        with self.lock:
+            fresh = time.monotonic() - self.refreshed_at < self.ttl
+            if fresh and not force and (self.recursive or not recursive):
+                return
+            files: Dict[str, FileInfo] = {}
+            seen_dirs = set()
+            pending = [("", 0)]
+            while pending:
+                rel, depth = pending.pop()
+                try:
+                    stat = os.stat(self._abs(rel))
+                    _, names, subdirs = self._list_dir(rel, stat.st_mtime_ns)
+                except OSError:
+                    continue
+                seen_dirs.add(rel)
+                for name in names:
+                    path = f"{rel}/{name}" if rel else name
+                    try:
+                        stat = os.stat(self._abs(path))
+                    except OSError:
+                        continue
+                    files[path] = FileInfo(stat.st_size, stat.st_mtime, stat.st_mtime_ns)
+                if recursive and depth < MAX_DEPTH:
+                    pending.extend((f"{rel}/{name}" if rel else name, depth + 1) for name in subdirs)
+
+            for rel in list(self.dirs):
+                if rel not in seen_dirs:
+                    del self.dirs[rel]
+            for path in list(self.hashes):
+                if files.get(path) != self.hashes[path][0]:
+                    del self.hashes[path]
+            if files.keys() != self.files.keys():
+                self.sorted_names = None
+            self.files = files
+            self.recursive = recursive
+            self.refreshed_at = time.monotonic()
+
+    def list(
+        self,
+        extensions: List[str],
+        recursive: bool = False,
+        force: bool = False,
+    ) -> List[dict]:
+        """Files with one of extensions, sorted by path: {"name", "size", "mtime"}."""
+        self.refresh(recursive, force)
+        suffixes = tuple("." + ext.strip().lower().lstrip(".") for ext in extensions if ext.strip())
+        with self.lock:
+            if self.sorted_names is None:
+                self.sorted_names = sorted(self.files)
+            names, files = self.sorted_names, self.files
+        return [
+            {"name": name, "size": files[name].size, "mtime": files[name].mtime}
+            for name in names
+            if name.lower().endswith(suffixes) and (recursive or "/" not in name)
+        ]
+
+    def content_hash(self, name: str) -> Optional[str]:
+        """sha256 of a listed file, cached until it changes."""
+        with self.lock:
+            info = self.files.get(name)
+            cached = self.hashes.get(name)
+        if info is None:
+            return None
+        if cached is not None and cached[0] == info:
+            return cached[1]
+        digest = hashlib.sha256()
+        try:
+            with open(self._abs(name), "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        with self.lock:
+            self.hashes[name] = (info, digest.hexdigest())
+        return digest.hexdigest()
@@ -0,0 +1,415 @@
+"""
+Distributed grading: batches split into (file, test) tasks that worker
+processes, on this machine or others, take from a shared queue.
+
+The queue is a SQLite database (TaskQueue). DistributedBatchRunner is a
+BatchRunner whose tasks go into the queue instead of a local thread pool;
+it collects the graded results back into the usual batch response.
+Workers (QueueWorker) claim tasks one at a time per thread, grade them with
+an ordinary Executor and report how many tasks they finished and how long
+they were busy, from which their throughput is shown.
+
+Workers see tasks as absolute file paths, so a worker on another host
+needs the work directory mounted at the same path, and the queue file on
+storage all hosts can lock (a local disk for localhost workers). Tests
+with a benchmark setting are still timed by the coordinator, one at a
+time, like in a local batch. When no worker is alive the coordinator
+grades tasks itself so a batch never stalls.
+
+Run a worker as a script: python distributed.py QUEUE_PATH [--threads N]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from batch import BatchRunner, cancelled_result, default_worker_count, grade_test_case, not_run_result
+from bytecode_cache import BytecodeCache
+from executor import Executor
+from result_cache import ResultCache
+from sandbox import ResourceLimits
+
+# Workers refresh last_seen this often; tasks held by a worker not seen for
+# STALE_SECONDS go back into the queue
+HEARTBEAT_SECONDS = 2.0
+STALE_SECONDS = 10.0
+POLL_SECONDS = 0.02
+MAX_IDLE_SLEEP = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker_id TEXT,
+    claimed_at REAL,
+    busy_time REAL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);
+CREATE INDEX IF NOT EXISTS tasks_batch ON tasks (batch_id, state);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    threads INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    tasks_done INTEGER NOT NULL DEFAULT 0,
+    busy_time REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+class TaskQueue:
+    """
+    Tasks (JSON payloads) of any number of batches, in a SQLite database
+    shared by the coordinator and the workers. A task is "pending" until a
+    worker claims it, then "claimed" until the worker stores its result
+    ("done"); the coordinator deletes tasks once it has collected them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit; claims use explicit BEGIN IMMEDIATE transactions
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+
+    def submit(self, batch_id: str, payloads: List[dict]) -> List[int]:
+        """Queues payloads; returns their task ids in the same order."""
+        ids = []
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for payload in payloads:
+                    cursor = self.conn.execute(
+                        "INSERT INTO tasks (batch_id, payload, state) VALUES (?, ?, 'pending')",
+                        (batch_id, json.dumps(payload)),
+                    )
+                    ids.append(cursor.lastrowid)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def claim(self, worker_id: str) -> Optional[Tuple[int, dict]]:
+        """The oldest pending task, now held by worker_id, or None."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT id, payload FROM tasks WHERE state = 'pending' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE tasks SET state = 'claimed', worker_id = ?, claimed_at = ? WHERE id = ?",
+                        (worker_id, time.time(), row[0]),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def complete(self, task_id: int, worker_id: str, result: dict, busy_time: float):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A task given to another worker in the meantime keeps its first result
+                cursor = self.conn.execute(
+                    "UPDATE tasks SET state = 'done', result = ?, busy_time = ? "
+                    "WHERE id = ? AND state = 'claimed' AND worker_id = ?",
+                    (json.dumps(result), busy_time, task_id, worker_id),
+                )
+                if cursor.rowcount:
+                    self.conn.execute(
+                        "UPDATE workers SET tasks_done = tasks_done + 1, busy_time = busy_time + ?, "
+                        "last_seen = ? WHERE worker_id = ?",
+                        (busy_time, time.time(), worker_id),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def collect(self, batch_id: str) -> List[Tuple[int, dict, str, float]]:
+        """Finished tasks of a batch as (task id, result, worker id, busy time), removed from the queue."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, result, worker_id, busy_time FROM tasks WHERE batch_id = ? AND state = 'done'",
+                (batch_id,),
+            ).fetchall()
+            if rows:
+                self.conn.executemany("DELETE FROM tasks WHERE id = ?", [(row[0],) for row in rows])
+        return [(task_id, json.loads(result), worker_id, busy_time) for task_id, result, worker_id, busy_time in rows]
+
+    def cancel(self, batch_id: str) -> List[int]:
+        """Removes the tasks of a batch no worker has claimed yet; returns their ids."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in self.conn.execute(
+                    "SELECT id FROM tasks WHERE batch_id = ? AND state = 'pending'", (batch_id,)
+                )]
+                self.conn.execute("DELETE FROM tasks WHERE batch_id = ? AND state = 'pending'", (batch_id,))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def drop(self, batch_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM tasks WHERE batch_id = ?", (batch_id,))
+
+    def requeue_stale(self, stale_after: float = STALE_SECONDS) -> int:
+        """Puts tasks held by workers that stopped sending heartbeats back in the queue."""
+        cutoff = time.time() - stale_after
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET state = 'pending', worker_id = NULL, claimed_at = NULL "
+                "WHERE state = 'claimed' AND worker_id NOT IN "
+                "(SELECT worker_id FROM workers WHERE last_seen >= ?)",
+                (cutoff,),
+            )
+        return cursor.rowcount
+
+    def heartbeat(self, worker_id: str, threads: int):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO workers (worker_id, host, pid, threads, started_at, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (worker_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (worker_id, socket.gethostname(), os.getpid(), threads, now, now),
+            )
+
+    def unregister(self, worker_id: str):
+        with self.lock:
+            self.conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def workers(self, alive_within: float = STALE_SECONDS) -> List[dict]:
+        """Live workers with their totals and throughput (tasks per second since they started)."""
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT worker_id, host, pid, threads, started_at, last_seen, tasks_done, busy_time "
+                "FROM workers WHERE last_seen >= ? ORDER BY worker_id",
+                (now - alive_within,),
+            ).fetchall()
+        workers = []
+        for worker_id, host, pid, threads, started_at, last_seen, tasks_done, busy_time in rows:
+            uptime = max(now - started_at, 1e-9)
+            workers.append({
+                "worker_id": worker_id,
+                "host": host,
+                "pid": pid,
+                "threads": threads,
+                "uptime": uptime,
+                "tasks_done": tasks_done,
+                "busy_time": busy_time,
+                "tasks_per_second": tasks_done / uptime,
+                # Share of its threads' time spent grading
+                "utilization": busy_time / (uptime * threads),
+            })
+        return workers
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE state = 'pending'").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def grade_task(executor: Executor, payload: dict) -> dict:
+    """
+    grade_test_case for a queued task. Any error (e.g. the file is gone or
+    not visible from this machine) becomes an ERROR result, so the task is
+    completed instead of staying claimed forever.
+    """
+    try:
+        return grade_test_case(executor, payload["filepath"], payload["index"], payload["test_case"])
+    except Exception as e:
+        return not_run_result(payload["index"], "ERROR", f"{type(e).__name__}: {e}")
+
+
+class DistributedBatchRunner(BatchRunner):
+    """
+    BatchRunner handing its (file, test) tasks to queue workers. The response
+    is the same as a local batch; stats["workers"] is the number of live
+    workers and stats["worker_tasks"] how many tasks each one graded.
+    """
+
+    def __init__(self, work_dir: str, executor: Executor, queue: TaskQueue, max_workers: Optional[int] = None, dedupe: bool = True):
+        super().__init__(work_dir, executor, max_workers, dedupe)
+        self.queue = queue
+        self.coordinator_id = f"coordinator-{socket.gethostname()}-{os.getpid()}"
+        self.worker_tasks: Dict[str, dict] = {}
+
+    def execute(self, tasks: List[tuple], cancel_event: Optional[threading.Event] = None) -> Iterator[Tuple[tuple, dict]]:
+        batch_id = uuid.uuid4().hex
+        use_cache = self.executor.cache is not None
+        ids = self.queue.submit(batch_id, [
+            {"filepath": filepath, "index": i, "test_case": tc, "use_cache": use_cache}
+            for _, _, i, filepath, tc in tasks
+        ])
+        waiting = dict(zip(ids, tasks))
+        delay = POLL_SECONDS
+        try:
+            while waiting:
+                if cancel_event is not None and cancel_event.is_set():
+                    for task_id in self.queue.cancel(batch_id):
+                        task = waiting.pop(task_id)
+                        yield task, cancelled_result(task[2])
+
+                finished = self.queue.collect(batch_id)
+                for task_id, result, worker_id, busy_time in finished:
+                    self._count(worker_id, busy_time)
+                    yield waiting.pop(task_id), result
+                if finished:
+                    delay = POLL_SECONDS
+                    continue
+
+                self.queue.requeue_stale()
+                if not self.queue.workers() and self._grade_one():
+                    continue
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_IDLE_SLEEP)
+        finally:
+            self.queue.drop(batch_id)
+
+    def _grade_one(self) -> bool:
+        # Stand-in for missing workers: grade one queued task here
+        self.queue.heartbeat(self.coordinator_id, 1)
+        try:
+            claimed = self.queue.claim(self.coordinator_id)
+            if claimed is None:
+                return False
+            task_id, payload = claimed
+            start_time = time.perf_counter()
+            result = grade_task(self.executor, payload)
+            self.queue.complete(task_id, self.coordinator_id, result, time.perf_counter() - start_time)
+            return True
+        finally:
+            self.queue.unregister(self.coordinator_id)
+
+    def _count(self, worker_id: str, busy_time: float):
+        counts = self.worker_tasks.setdefault(worker_id, {"tasks": 0, "busy_time": 0.0})
+        counts["tasks"] += 1
+        counts["busy_time"] += busy_time or 0.0
+
+    def run(self, *args, **kwargs) -> dict:
+        self.worker_tasks = {}
+        response = super().run(*args, **kwargs)
+        response["stats"]["workers"] = len(self.queue.workers())
+        response["stats"]["worker_tasks"] = self.worker_tasks
+        return response
+
+
+class QueueWorker:
+    """
+    Grades tasks from a TaskQueue with threads threads until stopped,
+    using executors[use_cache] of the task.
+    """
+
+    def __init__(self, queue: TaskQueue, executors: Dict[bool, Executor], threads: Optional[int] = None, worker_id: Optional[str] = None):
+        self.queue = queue
+        self.executors = executors
+        self.threads = max(1, threads or default_worker_count())
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.stop_event = threading.Event()
+
+    def serve(self, report_every: float = 10.0):
+        self.queue.heartbeat(self.worker_id, self.threads)
+        workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        last_report = time.monotonic()
+        try:
+            while not self.stop_event.wait(HEARTBEAT_SECONDS):
+                self.queue.heartbeat(self.worker_id, self.threads)
+                if report_every and time.monotonic() - last_report >= report_every:
+                    last_report = time.monotonic()
+                    self._report()
+        finally:
+            self.stop_event.set()
+            for thread in workers:
+                thread.join()
+            self._report()
+            self.queue.unregister(self.worker_id)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _work(self):
+        delay = POLL_SECONDS
+        while not self.stop_event.is_set():
+            claimed = self.queue.claim(self.worker_id)
+            if claimed is None:
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, MAX_IDLE_SLEEP)
+                continue
+            delay = POLL_SECONDS
+            task_id, payload = claimed
+            start_time = time.perf_counter()
+            executor = self.executors[payload.get("use_cache", True)]
+            result = grade_task(executor, payload)
+            self.queue.complete(task_id, self.worker_id, result, time.perf_counter() - start_time)
+
+    def _report(self):
+        for worker in self.queue.workers():
+            if worker["worker_id"] == self.worker_id:
+                print(
+                    f"{self.worker_id}: {worker['tasks_done']} tasks, "
+                    f"{worker['tasks_per_second']:.1f} tasks/s, "
+                    f"{worker['utilization']:.0%} busy",
+                    flush=True,
+                )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Grade tasks from a program checker queue.")
+    parser.add_argument("queue", help="path of the queue database (PROGRAM_CHECKER_QUEUE of the backend)")
+    parser.add_argument("--threads", type=int, default=None, help="tests graded at once (default: CPU count)")
+    parser.add_argument("--id", dest="worker_id", default=None, help="worker name (default: host-pid)")
+    args = parser.parse_args(argv)
+
+    # Same environment settings as the backend
+    cache_dir = os.environ.get(
+        "PROGRAM_CHECKER_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".program_checker")
+    )
+    limits = None
+    if os.environ.get("PROGRAM_CHECKER_SANDBOX") == "1" and ResourceLimits.is_supported():
+        limits = ResourceLimits()
+    bytecode = BytecodeCache(os.path.join(cache_dir, "bytecode"))
+    executors = {
+        True: Executor(cache=ResultCache(os.path.join(cache_dir, "result_cache.sqlite3")), limits=limits, bytecode=bytecode),
+        False: Executor(limits=limits, bytecode=bytecode),
+    }
+
+    worker = QueueWorker(TaskQueue(args.queue), executors, args.threads, args.worker_id)
+    # Finish the tests in progress, then leave the queue
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    print(f"{worker.worker_id}: grading tasks from {args.queue} with {worker.threads} threads", flush=True)
+    worker.serve()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
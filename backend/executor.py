@@ -1,40 +1,453 @@
 import subprocess
 import time
-from typing import Tuple
+from typing import List, NamedTuple, Optional, Tuple
 import sys
 import os
+import json
+import locale
+import tempfile
+import select
+import selectors
+import threading
+
+from sandbox import LIMITS_ENV, ResourceLimits, ResourceUsage, classify_limit, rusage_values
+import metrics
+import tracing
+
+# Bytes of stdout/stderr kept per stream (half from the start, half from the end)
+DEFAULT_CAPTURE_BYTES = 1024 * 1024
+# Combined stdout+stderr volume after which the program is killed
+DEFAULT_OUTPUT_LIMIT = 16 * 1024 * 1024
+# Runs a program under cProfile/tracemalloc in profile mode
+PROFILE_RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile_runner.py")
+# Share of the timeout after which a profiled program reports what it has so far
+PROFILE_BUDGET = 0.9
+# Runs a program from its cached bytecode, or under resource limits
+BYTECODE_RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bytecode_runner.py")
+
+class RunResult(NamedTuple):
+    stdout: str
+    stderr: str
+    execution_time: float
+    is_timeout: bool
+    # "OUTPUT_LIMIT", "CPU_LIMIT" or "MEMORY_LIMIT" when a limit ended the run
+    limit: Optional[str] = None
+    returncode: Optional[int] = None
+    # Resource usage of the program where measurable (POSIX), else None
+    cpu_time: Optional[float] = None  # user + sys seconds
+    user_time: Optional[float] = None
+    sys_time: Optional[float] = None
+    max_rss: Optional[int] = None  # peak resident set size in bytes
+    # Report of profile_runner.py for runs in profile mode
+    profile: Optional[dict] = None
+
+class OutputCapture:
+    """
+    Bounded capture of one stream: keeps the first and last keep_bytes/2
+    bytes and counts what was dropped in between.
+    """
+
+    def __init__(self, keep_bytes: int = DEFAULT_CAPTURE_BYTES):
+        self.head_limit = keep_bytes // 2
+        self.tail_limit = keep_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes):
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            excess = len(self.tail) - self.tail_limit
+            if excess > 0:
+                del self.tail[:excess]
+
+    def getvalue(self) -> bytes:
+        omitted = self.total - len(self.head) - len(self.tail)
+        if omitted <= 0:
+            return bytes(self.head + self.tail)
+        marker = f"\n... [{omitted} bytes omitted] ...\n".encode("ascii")
+        return bytes(self.head) + marker + bytes(self.tail)
+
+def decode_output(data: bytes) -> str:
+    # Matches subprocess text mode: locale encoding, universal newlines
+    text = data.decode(locale.getpreferredencoding(False), errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def encode_input(input_data: str) -> bytes:
+    return input_data.encode(locale.getpreferredencoding(False))
+
+def wait_process(process: subprocess.Popen, deadline: float) -> Tuple[int, Optional[ResourceUsage], bool]:
+    """
+    Reaps process, killing it if it is still running at deadline (a
+    time.monotonic() value). Uses wait4 where available so the resource
+    usage of the child is known, and a pidfd (Linux) to notice the exit
+    without polling so timings are not skewed.
+    Returns: (returncode, usage, is_timeout)
+    """
+    if not hasattr(os, "wait4"):
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            return process.returncode, None, False
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return process.returncode, None, True
+
+    is_timeout = not _wait_exit(process.pid, deadline)
+    if is_timeout:
+        process.kill()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, rusage_values(usage), is_timeout
+
+def _wait_exit(pid: int, deadline: float) -> bool:
+    # True once pid has exited (still unreaped), False at the deadline
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        try:
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            return bool(poller.poll(max(0.0, deadline - time.monotonic()) * 1000))
+        finally:
+            os.close(pidfd)
+
+    delay = 0.0005
+    while time.monotonic() < deadline:
+        info = os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+        if info is not None and info.si_pid:
+            return True
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return False
+
+def communicate_fds(
+    stdin_fd: int,
+    stdout_fd: int,
+    stderr_fd: int,
+    input_data: bytes,
+    timeout: float,
+    capture_bytes: int = DEFAULT_CAPTURE_BYTES,
+    output_limit: int = DEFAULT_OUTPUT_LIMIT,
+) -> Tuple[bytes, bytes, bool, bool]:
+    """
+    Feeds input_data to stdin_fd and drains stdout_fd/stderr_fd until both
+    reach EOF, the timeout expires or more than output_limit bytes were
+    produced. Output is read incrementally into bounded captures, so a
+    runaway program never grows our memory beyond capture_bytes per stream.
+    The descriptors are owned (and eventually closed) by this function; the
+    caller is expected to kill the program on timeout or output limit.
+    Returns: (stdout, stderr, is_timeout, output_limited)
+    """
+    if sys.platform == "win32":
+        # selectors only supports sockets on Windows
+        return _communicate_threads(stdin_fd, stdout_fd, stderr_fd, input_data, timeout, capture_bytes, output_limit)
+
+    deadline = time.monotonic() + timeout
+    captures = {stdout_fd: OutputCapture(capture_bytes), stderr_fd: OutputCapture(capture_bytes)}
+    offset = 0
+    produced = 0
+    is_timeout = False
+    output_limited = False
+
+    with selectors.DefaultSelector() as selector:
+        if input_data:
+            os.set_blocking(stdin_fd, False)
+            selector.register(stdin_fd, selectors.EVENT_WRITE)
+        else:
+            os.close(stdin_fd)
+        selector.register(stdout_fd, selectors.EVENT_READ)
+        selector.register(stderr_fd, selectors.EVENT_READ)
+
+        while selector.get_map() and not output_limited:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                is_timeout = True
+                break
+            for key, _ in selector.select(remaining):
+                fd = key.fd
+                if fd == stdin_fd:
+                    try:
+                        offset += os.write(fd, input_data[offset:offset + 65536])
+                    except BrokenPipeError:
+                        # The program exited without reading all of its input
+                        offset = len(input_data)
+                    if offset >= len(input_data):
+                        selector.unregister(fd)
+                        os.close(fd)
+                    continue
+                data = os.read(fd, 65536)
+                if data:
+                    captures[fd].write(data)
+                    produced += len(data)
+                    if produced > output_limit:
+                        output_limited = True
+                        break
+                else:
+                    selector.unregister(fd)
+                    os.close(fd)
+
+        for key in list(selector.get_map().values()):
+            selector.unregister(key.fd)
+            os.close(key.fd)
+
+    return captures[stdout_fd].getvalue(), captures[stderr_fd].getvalue(), is_timeout, output_limited
+
+def _communicate_threads(stdin_fd, stdout_fd, stderr_fd, input_data, timeout, capture_bytes, output_limit):
+    # Thread-per-pipe variant of communicate_fds, as subprocess does on Windows
+    captures = {stdout_fd: OutputCapture(capture_bytes), stderr_fd: OutputCapture(capture_bytes)}
+    lock = threading.Lock()
+    stop = threading.Event()
+    state = {"open": 2, "produced": 0, "limited": False}
+
+    def write_input():
+        try:
+            os.write(stdin_fd, input_data)
+        except OSError:
+            pass
+        finally:
+            os.close(stdin_fd)
+
+    def read_output(fd):
+        try:
+            while True:
+                data = os.read(fd, 65536)
+                if not data:
+                    break
+                with lock:
+                    if stop.is_set():
+                        continue  # keep draining so the child is not blocked
+                    captures[fd].write(data)
+                    state["produced"] += len(data)
+                    if state["produced"] > output_limit:
+                        state["limited"] = True
+                        stop.set()
+        finally:
+            os.close(fd)
+            with lock:
+                state["open"] -= 1
+                if state["open"] == 0:
+                    stop.set()
+
+    for target, args in ((write_input, ()), (read_output, (stdout_fd,)), (read_output, (stderr_fd,))):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    is_timeout = not stop.wait(timeout)
+    with lock:
+        stop.set()
+        return captures[stdout_fd].getvalue(), captures[stderr_fd].getvalue(), is_timeout, state["limited"]
+
+def read_profile(report_path: str) -> Optional[dict]:
+    # The report profile_runner.py left behind (None if the program was
+    # killed before writing one); the file is removed either way
+    try:
+        with open(report_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+    finally:
+        try:
+            os.remove(report_path)
+        except OSError:
+            pass
+
+def record_execution(result: RunResult):
+    # Outcome and duration of a real (not cached) execution, for /metrics
+    if result.is_timeout:
+        outcome = "timeout"
+    elif result.limit:
+        outcome = result.limit.lower()
+    elif result.returncode != 0 or result.stderr:
+        outcome = "error"
+    else:
+        outcome = "ok"
+    metrics.EXECUTIONS.inc(outcome=outcome)
+    metrics.RUN_SECONDS.observe(result.execution_time)
 
 class Executor:
-    def __init__(self, timeout: int = 5):
+    def __init__(
+        self,
+        timeout: int = 5,
+        fork_server=None,
+        cache=None,
+        capture_bytes: int = DEFAULT_CAPTURE_BYTES,
+        output_limit: int = DEFAULT_OUTPUT_LIMIT,
+        limits: Optional[ResourceLimits] = None,
+        bytecode=None,
+    ):
         self.timeout = timeout
+        # Optional forkserver.ForkServer; falls back to a fresh interpreter
+        # per run when it is None or unreachable.
+        self.fork_server = fork_server
+        # Optional result_cache.ResultCache consulted before spawning anything
+        self.cache = cache
+        self.capture_bytes = capture_bytes
+        self.output_limit = output_limit
+        # Optional sandbox.ResourceLimits applied to the child (POSIX only)
+        self.limits = limits if limits is not None and limits.is_supported() else None
+        # Optional bytecode_cache.BytecodeCache; programs then run from
+        # their compiled code instead of being compiled for every run
+        self.bytecode = bytecode
 
-    def run(self, filepath: str, input_data: str) -> Tuple[str, str, float, bool]:
+    def run(self, filepath: str, input_data: str, use_cache: bool = True, profile: Optional[dict] = None) -> RunResult:
         """
         Runs the python script at filepath with input_data.
-        Returns: (stdout, stderr, execution_time, is_timeout)
+        use_cache=False forces a fresh execution (e.g. for timing).
+        profile ({"top", "memory"}) runs it under profile_runner.py and
+        sets RunResult.profile; such runs are cached separately.
+        Returns a RunResult (stdout, stderr, execution_time, is_timeout, ...)
         """
-        start_time = time.time()
-        try:
+        with tracing.span("Executor.run", file=os.path.basename(filepath)) as span:
+            if self.cache is None or not use_cache:
+                return self._execute_counted(filepath, input_data, profile)
+
+            with tracing.span("cache_lookup"):
+                key = self.cache.make_key(filepath, input_data, self.cache_settings(profile))
+                result = self.cache.get(key)
+            if result is None:
+                result = self._execute_counted(filepath, input_data, profile)
+                with tracing.span("cache_store"):
+                    self.cache.put(key, filepath, result)
+            else:
+                span.set(cached=True)
+                metrics.EXECUTIONS.inc(outcome="cached")
+            return result
+
+    def _execute_counted(self, filepath: str, input_data: str, profile: Optional[dict] = None) -> RunResult:
+        with metrics.ACTIVE_PROCESSES.track():
+            result = self._execute(filepath, input_data, profile)
+        record_execution(result)
+        return result
+
+    def cache_settings(self, profile: Optional[dict] = None) -> tuple:
+        # Everything besides source and input that changes a run's result
+        if profile is None:
+            return (self.timeout, self.limits)
+        return (self.timeout, self.limits, ("profile", tuple(sorted(profile.items()))))
+
+    def bytecode_path(self, filepath: str) -> Optional[str]:
+        # Compiled code of filepath, None without a cache or if it doesn't compile
+        if self.bytecode is None:
+            return None
+        with tracing.span("bytecode"):
+            return self.bytecode.compile(filepath).bytecode_path
+
+    def program_args(self, filepath: str, profile: Optional[dict] = None) -> Tuple[List[str], Optional[str]]:
+        """Command line running filepath, and the report path in profile mode."""
+        if profile is None:
             # Ensure we use the same python interpreter
-            python_executable = sys.executable
-            
-            process = subprocess.Popen(
-                [python_executable, filepath],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=os.path.dirname(filepath) # Run in the file's directory
-            )
-            
-            stdout, stderr = process.communicate(input=input_data, timeout=self.timeout)
-            execution_time = time.time() - start_time
-            return stdout, stderr, execution_time, False
+            bytecode_path = self.bytecode_path(filepath)
+            if bytecode_path is not None or self.limits is not None:
+                # The runner applies the limits (program_env), compiling filepath if needed
+                return [sys.executable, BYTECODE_RUNNER, bytecode_path or "", filepath], None
+            return [sys.executable, filepath], None
+        fd, report_path = tempfile.mkstemp(prefix="program_checker_profile_", suffix=".json")
+        os.close(fd)
+        args = [
+            sys.executable, PROFILE_RUNNER, report_path,
+            str(profile.get("top", 20)), "1" if profile.get("memory") else "0",
+            str(self.timeout * PROFILE_BUDGET), filepath,
+        ]
+        return args, report_path
 
-        except subprocess.TimeoutExpired:
+    def program_env(self) -> Optional[dict]:
+        # Environment of program_args: the runners apply the resource limits
+        # themselves rather than a preexec_fn in the forked child
+        if self.limits is None:
+            return None
+        return dict(os.environ, **{LIMITS_ENV: self.limits.to_env()})
+
+    def communicate(self, stdin_fd: int, stdout_fd: int, stderr_fd: int, input_data: str) -> Tuple[bytes, bytes, bool, bool]:
+        # communicate_fds with this executor's timeout and output limits
+        return communicate_fds(
+            stdin_fd, stdout_fd, stderr_fd, encode_input(input_data), self.timeout,
+            self.capture_bytes, self.output_limit
+        )
+
+    def _execute(self, filepath: str, input_data: str, profile: Optional[dict] = None) -> RunResult:
+        if self.fork_server is not None and profile is None:
+            try:
+                with tracing.span("fork_server"):
+                    return self.fork_server.run(filepath, input_data, self)
+            except OSError:
+                pass
+
+        deadline = time.monotonic() + self.timeout
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        args, report_path = self.program_args(filepath, profile)
+        spawn_start = time.perf_counter()
+        with tracing.span("spawn"):
+            try:
+                process = subprocess.Popen(
+                    args,
+                    stdin=stdin_r,
+                    stdout=stdout_w,
+                    stderr=stderr_w,
+                    cwd=os.path.dirname(filepath), # Run in the file's directory
+                    env=self.program_env(),
+                )
+            except Exception as e:
+                for fd in (stdin_w, stdout_r, stderr_r):
+                    os.close(fd)
+                if report_path is not None:
+                    read_profile(report_path)
+                return RunResult("", str(e), 0.0, False)
+            finally:
+                # The child holds its own copies now
+                for fd in (stdin_r, stdout_w, stderr_w):
+                    os.close(fd)
+
+        # Timed from the moment the program exists, so spawning is not counted
+        start_time = time.perf_counter()
+        metrics.SPAWN_SECONDS.observe(start_time - spawn_start, method="popen")
+        with tracing.span("communicate"):
+            stdout, stderr, is_timeout, output_limited = self.communicate(stdin_w, stdout_r, stderr_r, input_data)
+        if is_timeout or output_limited:
             process.kill()
-            execution_time = time.time() - start_time
-            return "", "Timeout Expired", execution_time, True
-        except Exception as e:
-            execution_time = time.time() - start_time
-            return "", str(e), execution_time, False
+        # The program may close its pipes and keep running
+        with tracing.span("wait"):
+            returncode, usage, wait_timeout = wait_process(process, deadline)
+        execution_time = time.perf_counter() - start_time
+        with tracing.span("decode_output"):
+            result = self.make_result(
+                stdout, stderr, execution_time, is_timeout or wait_timeout, output_limited, returncode, usage
+            )
+        if report_path is not None:
+            result = result._replace(profile=read_profile(report_path))
+        return result
+
+    def make_result(
+        self,
+        stdout: bytes,
+        stderr: bytes,
+        execution_time: float,
+        is_timeout: bool,
+        output_limited: bool,
+        returncode: Optional[int],
+        usage: Optional[ResourceUsage],
+    ) -> RunResult:
+        resources = {}
+        if usage is not None:
+            resources = {
+                "cpu_time": usage.cpu_time,
+                "user_time": usage.user_time,
+                "sys_time": usage.sys_time,
+                "max_rss": usage.max_rss,
+            }
+        if is_timeout:
+            return RunResult("", "Timeout Expired", execution_time, True, returncode=returncode, **resources)
+        stdout_text = decode_output(stdout)
+        stderr_text = decode_output(stderr)
+        limit = "OUTPUT_LIMIT" if output_limited else classify_limit(returncode, stderr_text, self.limits)
+        return RunResult(stdout_text, stderr_text, execution_time, False, limit, returncode, **resources)
@@ -0,0 +1,315 @@
+"""
+Pre-forked Python worker server.
+
+Starting a fresh interpreter for every test case costs tens of milliseconds,
+which dwarfs the run time of most student programs. The fork server is a
+warm interpreter with commonly used stdlib modules already imported. For
+each run it forks a handler, which forks the actual child, wires the pipes
+sent by the client onto fd 0/1/2 and executes the target file as __main__.
+The handler waits for the child and reports its exit status, so every test
+still runs in its own process while startup is paid only once.
+
+POSIX only (fork + SCM_RIGHTS). Run as a script: python forkserver.py SOCKET
+"""
+import atexit
+import json
+import marshal
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from executor import Executor, RunResult
+from sandbox import ResourceLimits, ResourceUsage, rusage_values
+import metrics
+
+# Imported once in the server so that children start with them loaded.
+PRELOAD_MODULES = [
+    "math", "random", "collections", "itertools", "functools", "heapq",
+    "bisect", "re", "string", "datetime", "decimal", "fractions",
+    "statistics", "json", "copy", "typing", "dataclasses", "operator",
+    "traceback", "io", "types",
+]
+
+# Modules loaded from here are the backend's, never the submission's
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run_child(request: dict, fds: list):
+    # Runs inside the forked child; never returns.
+    import random
+    import traceback
+    import types
+
+    exit_code = 0
+    try:
+        for target, fd in zip((0, 1, 2), fds):
+            os.dup2(fd, target)
+            os.close(fd)
+
+        if request.get("limits") is not None:
+            ResourceLimits(*request["limits"]).apply()
+
+        filepath = request["filepath"]
+        os.chdir(request["cwd"])
+        sys.argv = [filepath]
+        sys.path[0] = os.path.dirname(filepath)
+        # Our own modules must not shadow a student's file of the same name
+        for name, module in list(sys.modules.items()):
+            module_file = getattr(module, "__file__", None)
+            if module_file and os.path.dirname(os.path.abspath(module_file)) == BACKEND_DIR:
+                del sys.modules[name]
+        # The server's RNG state is inherited by every fork
+        random.seed()
+
+        # Compiled ahead of time when the executor has a bytecode cache
+        code = None
+        if request.get("bytecode"):
+            try:
+                with open(request["bytecode"], "rb") as f:
+                    code = marshal.load(f)
+            except (OSError, EOFError, ValueError, TypeError):
+                code = None
+        if code is None:
+            with open(filepath, "rb") as f:
+                source = f.read()
+
+        module = types.ModuleType("__main__")
+        module.__file__ = filepath
+        sys.modules["__main__"] = module
+        # Only the program's own exit handlers run at its end
+        atexit._clear()
+        try:
+            if code is None:
+                code = compile(source, filepath, "exec")
+            exec(code, module.__dict__)
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException as e:
+            # Skip this frame so the traceback starts at the student's code
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            exit_code = 1
+        # What the interpreter does before exiting: wait for non-daemon
+        # threads, then run the atexit handlers
+        threading._shutdown()
+        atexit._run_exitfuncs()
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        os._exit(exit_code)
+
+
+def _handle(conn: socket.socket):
+    # Runs inside the per-request handler process; never returns.
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        msg, fds, _, _ = socket.recv_fds(conn, 65536, 3)
+        request = json.loads(msg.decode("utf-8"))
+
+        start_time = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            _run_child(request, fds)
+
+        for fd in fds:
+            os.close(fd)
+        conn.sendall((json.dumps({"pid": pid}) + "\n").encode("utf-8"))
+        _, status, usage = os.wait4(pid, 0)
+        reply = {
+            "returncode": os.waitstatus_to_exitcode(status),
+            # Measured here so that socket and pipe overhead is not counted
+            "wall_time": time.perf_counter() - start_time,
+            "usage": list(rusage_values(usage)),
+        }
+        conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+    finally:
+        os._exit(0)
+
+
+def serve(socket_path: str):
+    for name in PRELOAD_MODULES:
+        __import__(name)
+
+    parent = os.getppid()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    listener.settimeout(1.0)
+    # Handlers are never waited for by the server
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    print("ready", flush=True)
+
+    while True:
+        try:
+            conn, _ = listener.accept()
+        except socket.timeout:
+            # Exit together with the backend that started us
+            if os.getppid() != parent:
+                break
+            continue
+        conn.settimeout(None)
+        if os.fork() == 0:
+            listener.close()
+            _handle(conn)
+        conn.close()
+
+    listener.close()
+    os.unlink(socket_path)
+
+
+class ForkServer:
+    """Client side: starts the server process and runs files through it."""
+
+    @staticmethod
+    def is_supported() -> bool:
+        return hasattr(os, "fork") and hasattr(socket, "send_fds")
+
+    def __init__(self):
+        self.socket_path = None
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        self.socket_path = os.path.join(tempfile.mkdtemp(prefix="forkserver-"), "server.sock")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self.socket_path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        if self.process.stdout.readline().strip() != "ready":
+            self.stop()
+            raise OSError("fork server failed to start")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def run(self, filepath: str, input_data: str, executor: Executor) -> RunResult:
+        """
+        Same contract as Executor.run, using the executor's timeout and
+        output limits. Raises OSError when the server cannot be reached.
+        """
+        with self.lock:
+            self.start()
+
+        start_time = time.perf_counter()
+        deadline = time.monotonic() + executor.timeout
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+            request = {
+                "filepath": filepath,
+                "cwd": os.path.dirname(filepath),
+                "limits": list(executor.limits) if executor.limits is not None else None,
+                "bytecode": executor.bytecode_path(filepath),
+            }
+            socket.send_fds(sock, [json.dumps(request).encode("utf-8")], [stdin_r, stdout_w, stderr_w])
+        except BaseException:
+            sock.close()
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise
+        finally:
+            # The server holds its own copies now
+            for fd in (stdin_r, stdout_w, stderr_w):
+                os.close(fd)
+
+        messages = _MessageReader(sock)
+        try:
+            pid = messages.read()["pid"]
+        except BaseException:
+            sock.close()
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise
+        metrics.SPAWN_SECONDS.observe(time.perf_counter() - start_time, method="fork_server")
+
+        with sock:
+            # communicate takes ownership of our ends of the pipes
+            stdout, stderr, is_timeout, output_limited = executor.communicate(stdin_w, stdout_r, stderr_r, input_data)
+            # The program has run by now: errors past this point are reported
+            # in its result, never by raising (the caller would run it again)
+            try:
+                status = self._wait_status(sock, messages, pid, deadline, is_timeout or output_limited)
+            except OSError as e:
+                _kill(pid)
+                status = None
+                stderr += f"\nfork server: {e}\n".encode("utf-8")
+        execution_time = time.perf_counter() - start_time
+        returncode, usage = None, None
+        if status is not None:
+            is_timeout = is_timeout or status.get("timeout", False)
+            returncode, usage = status["returncode"], ResourceUsage(*status["usage"])
+            if not is_timeout:
+                execution_time = status["wall_time"]
+
+        return executor.make_result(stdout, stderr, execution_time, is_timeout, output_limited, returncode, usage)
+
+    @staticmethod
+    def _wait_status(sock: socket.socket, messages: "_MessageReader", pid: int, deadline: float, killed: bool) -> dict:
+        # The handler sends the exit status once the child is reaped
+        if killed:
+            _kill(pid)
+            sock.settimeout(None)
+            return messages.read()
+        # The program may have closed its pipes and still be running, so wait
+        # for that only until the deadline
+        sock.settimeout(max(0.001, deadline - time.monotonic()))
+        try:
+            return messages.read()
+        except socket.timeout:
+            _kill(pid)
+            sock.settimeout(None)
+            return dict(messages.read(), timeout=True)
+
+
+def _kill(pid: int):
+    # The handler may have reaped the child already
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class _MessageReader:
+    # Newline-delimited JSON from the handler, read straight off the socket
+    # so that a timeout never loses buffered data.
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.buffer = b""
+
+    def read(self) -> dict:
+        while b"\n" not in self.buffer:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError("fork server closed the connection")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line.decode("utf-8"))
+
+if __name__ == "__main__":
+    serve(sys.argv[1])
@@ -0,0 +1,167 @@
+"""
+Synthetic grading workspaces for benchmarks (see bench_grading.py).
+
+Writes N submissions drawn from a mix of program kinds, plus their test
+cases in the workspace's grading.sqlite3:
+
+- fast: adds two numbers
+- cpu_heavy: a few million loop iterations, then the answer
+- infinite_loop: never finishes (TIMEOUT)
+- huge_output: prints more than the output limit (OUTPUT_LIMIT)
+- crash: raises after reading its input (ERROR)
+- syntax_error: does not compile (COMPILE_ERROR)
+- large_stdin: sums a large input (stdin_bytes per test)
+
+Every submission is textually unique unless duplicate_ratio asks for
+byte-identical copies, as copied homework would be.
+
+Usage: python generate_workspace.py DIR [--submissions N] [--mix fast=60,crash=5,...]
+"""
+import argparse
+import os
+import random
+from typing import Dict, List, Optional
+
+from grading_store import GradingStore
+
+DEFAULT_MIX = {
+    "fast": 60,
+    "cpu_heavy": 10,
+    "infinite_loop": 5,
+    "huge_output": 5,
+    "crash": 10,
+    "syntax_error": 5,
+    "large_stdin": 5,
+}
+
+PROGRAMS = {
+    "fast": """\
+a, b = map(int, input().split())
+print(a + b)
+""",
+    "cpu_heavy": """\
+a, b = map(int, input().split())
+total = 0
+for i in range(3_000_000):
+    total += i % 7
+print(a + b + total - total)
+""",
+    "infinite_loop": """\
+a, b = map(int, input().split())
+while True:
+    pass
+""",
+    "huge_output": """\
+import sys
+line = "x" * 1023 + "\\n"
+for _ in range(32 * 1024):
+    sys.stdout.write(line)
+""",
+    "crash": """\
+a, b = map(int, input().split())
+raise RuntimeError("submission crashed")
+""",
+    "syntax_error": """\
+a, b = map(int, input().split()
+print(a + b)
+""",
+    "large_stdin": """\
+import sys
+print(sum(map(int, sys.stdin.buffer.read().split())))
+""",
+}
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """"fast=60,crash=5" -> {"fast": 60, "crash": 5}"""
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in PROGRAMS:
+            raise ValueError(f"Unknown program kind: {kind}")
+        mix[kind] = int(weight) if weight else 1
+    return mix
+
+
+def make_test_case(kind: str, rng: random.Random, stdin_bytes: int) -> dict:
+    if kind == "large_stdin":
+        numbers = []
+        size = 0
+        while size < stdin_bytes:
+            number = rng.randint(0, 999_999)
+            numbers.append(number)
+            size += len(str(number)) + 1
+        return {"input_data": " ".join(map(str, numbers)), "expected_output": str(sum(numbers))}
+    a, b = rng.randint(-1000, 1000), rng.randint(-1000, 1000)
+    return {"input_data": f"{a} {b}", "expected_output": str(a + b)}
+
+
+def generate_workspace(
+    path: str,
+    submissions: int = 100,
+    mix: Optional[Dict[str, int]] = None,
+    tests_per_file: int = 3,
+    stdin_bytes: int = 1024 * 1024,
+    duplicate_ratio: float = 0.0,
+    seed: int = 0,
+) -> Dict[str, str]:
+    """
+    Fills path with submissions and their test cases; returns
+    {filename: kind}. The same seed gives the same workspace.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    kinds: List[str] = list(mix)
+    weights = [mix[kind] for kind in kinds]
+
+    # Test inputs are shared by every submission of a kind, like a real assignment
+    tests = {
+        kind: [make_test_case(kind, rng, stdin_bytes) for _ in range(tests_per_file)]
+        for kind in kinds
+    }
+
+    store = GradingStore(path)
+    generated: Dict[str, str] = {}
+    sources: List[tuple] = []
+    for n in range(1, submissions + 1):
+        filename = f"submission_{n:04d}.py"
+        if sources and rng.random() < duplicate_ratio:
+            kind, source = rng.choice(sources)
+        else:
+            kind = rng.choices(kinds, weights)[0]
+            source = f"# submission {n} ({kind})\n" + PROGRAMS[kind]
+            sources.append((kind, source))
+        with open(os.path.join(path, filename), "w", encoding="utf-8") as f:
+            f.write(source)
+        store.set(filename, tests[kind])
+        generated[filename] = kind
+    return generated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic grading workspace.")
+    parser.add_argument("path")
+    parser.add_argument("--submissions", type=int, default=100)
+    parser.add_argument("--mix", default=None, help="kind=weight,... (default: %s)" % ",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--tests", type=int, default=3, help="test cases per submission")
+    parser.add_argument("--stdin-bytes", type=int, default=1024 * 1024, help="input size of large_stdin tests")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="share of submissions copied from earlier ones")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generated = generate_workspace(
+        args.path, args.submissions, parse_mix(args.mix) if args.mix else None,
+        args.tests, args.stdin_bytes, args.duplicates, args.seed
+    )
+    counts: Dict[str, int] = {}
+    for kind in generated.values():
+        counts[kind] = counts.get(kind, 0) + 1
+    print(f"Generated {len(generated)} submissions in {args.path}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import metrics
+
+DB_NAME = "grading.sqlite3"
+LEGACY_CONFIG_NAME = "grading_config.json"
+# Runs kept per kind ("run", "grade", "batch", "watch"); older ones are
+# deleted together with their results, whose outputs can be large
+MAX_RUNS_PER_KIND = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS test_cases (
+    filename TEXT PRIMARY KEY,
+    cases TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    use_common INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    stats TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    test_case INTEGER,
+    status TEXT NOT NULL,
+    execution_time REAL,
+    cpu_time REAL,
+    user_time REAL,
+    sys_time REAL,
+    max_rss INTEGER,
+    input_data TEXT,
+    expected_output TEXT,
+    output TEXT,
+    error TEXT,
+    diff TEXT,
+    benchmark TEXT,
+    profile TEXT,
+    comparator TEXT
+);
+CREATE INDEX IF NOT EXISTS results_filename ON results (filename, test_case);
+CREATE INDEX IF NOT EXISTS results_status ON results (status, test_case);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+"""
+
+RESULT_COLUMNS = [
+    "id", "run_id", "filename", "test_case", "status", "execution_time",
+    "cpu_time", "user_time", "sys_time", "max_rss", "input_data", "expected_output", "output", "error", "diff",
+    "benchmark", "profile", "comparator",
+]
+
+# Columns added after the first release: (table, column, type)
+ADDED_COLUMNS = [
+    ("results", "cpu_time", "REAL"),
+    ("results", "max_rss", "INTEGER"),
+    ("results", "user_time", "REAL"),
+    ("results", "sys_time", "REAL"),
+    ("results", "benchmark", "TEXT"),
+    ("results", "profile", "TEXT"),
+    ("results", "comparator", "TEXT"),
+]
+
+
+def result_from_row(row) -> dict:
+    result = dict(zip(RESULT_COLUMNS, row))
+    for column in ("benchmark", "profile", "comparator"):
+        if result[column] is not None:
+            result[column] = json.loads(result[column])
+    return result
+
+
+class GradingStore:
+    """
+    Per work directory SQLite database holding the test cases of every file
+    and the results of every run.
+
+    Each file's test cases are one row (a JSON list in the same shape
+    grading_config.json used), so saving one file is a single-row write.
+    Results are stored one row per test, indexed by filename and status.
+    Only the newest max_runs_per_kind runs of each kind are kept (watch mode
+    records a run on every save).
+    An existing grading_config.json is imported the first time the database
+    is opened; the JSON file itself is left untouched.
+
+    load() keeps the parsed test cases in memory and only re-reads them when
+    another connection committed a change (PRAGMA data_version).
+    """
+
+    def __init__(self, work_dir: str, max_runs_per_kind: int = MAX_RUNS_PER_KIND):
+        self.work_dir = work_dir
+        self.max_runs_per_kind = max_runs_per_kind
+        self.path = os.path.join(work_dir, DB_NAME)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.migrate()
+        self.cases: Optional[Dict[str, list]] = None
+        self.data_version = None
+        self.import_legacy_config()
+
+    def migrate(self):
+        # Older databases lack columns that CREATE TABLE IF NOT EXISTS won't add
+        with self.lock, self.conn:
+            for table, column, column_type in ADDED_COLUMNS:
+                existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def import_legacy_config(self) -> int:
+        """Imports grading_config.json once. Returns the number of files imported."""
+        legacy_path = os.path.join(self.work_dir, LEGACY_CONFIG_NAME)
+        with self.lock:
+            done = self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone()
+            if done or not os.path.exists(legacy_path):
+                return 0
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                return 0
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO test_cases VALUES (?, ?, ?)",
+                    [(name, json.dumps(cases, ensure_ascii=False), now) for name, cases in data.items()]
+                )
+                self.conn.execute("INSERT INTO meta VALUES ('legacy_imported', ?)", (str(now),))
+            self.cases = None
+            return len(data)
+
+    # Test cases
+
+    @metrics.CONFIG_SECONDS.time(operation="load")
+    def load(self) -> Dict[str, list]:
+        """All test cases as {filename: [test case dict, ...]}. Treat as read-only."""
+        with self.lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if self.cases is None or version != self.data_version:
+                rows = self.conn.execute("SELECT filename, cases FROM test_cases").fetchall()
+                self.cases = {name: json.loads(cases) for name, cases in rows}
+                self.data_version = version
+            return self.cases
+
+    def get(self, filename: str) -> list:
+        return self.load().get(filename, [])
+
+    @metrics.CONFIG_SECONDS.time(operation="save")
+    def set(self, filename: str, test_cases: List[dict]):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO test_cases VALUES (?, ?, ?)",
+                    (filename, json.dumps(test_cases, ensure_ascii=False), time.time())
+                )
+            if self.cases is not None:
+                cases = dict(self.cases)
+                cases[filename] = test_cases
+                self.cases = cases
+
+    # Runs and results
+
+    def record_run(
+        self,
+        kind: str,
+        entries: List[dict],
+        use_common: bool = False,
+        stats: Optional[dict] = None,
+        config: Optional[Dict[str, list]] = None,
+    ) -> int:
+        """
+        Stores one run. entries use the batch response shape
+        ({"filename", "results": [...]}); every per-test result dict gets
+        the id of its row as "result_id". Results without input_data,
+        expected_output or comparator take them from config (the test cases
+        the run used).
+        Returns the run id.
+        """
+        with self.lock, self.conn:
+            run_id = self.conn.execute(
+                "INSERT INTO runs (kind, use_common, created_at, stats) VALUES (?, ?, ?, ?)",
+                (kind, int(use_common), time.time(), json.dumps(stats) if stats is not None else None)
+            ).lastrowid
+            for entry in entries:
+                test_cases = []
+                if config is not None:
+                    test_cases = config.get("__COMMON__" if use_common else entry["filename"], [])
+                for result in entry.get("results") or []:
+                    tc = {}
+                    index = (result.get("test_case") or 0) - 1
+                    if 0 <= index < len(test_cases):
+                        tc = test_cases[index]
+                    comparator = result.get("comparator", tc.get("comparator"))
+                    result["result_id"] = self.conn.execute(
+                        "INSERT INTO results (run_id, filename, test_case, status, execution_time,"
+                        " cpu_time, user_time, sys_time, max_rss, input_data, expected_output, output, error, diff,"
+                        " benchmark, profile, comparator) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            run_id,
+                            entry["filename"],
+                            result.get("test_case"),
+                            result["status"],
+                            result.get("execution_time"),
+                            result.get("cpu_time"),
+                            result.get("user_time"),
+                            result.get("sys_time"),
+                            result.get("max_rss"),
+                            result.get("input_data", tc.get("input_data")),
+                            result.get("expected_output", tc.get("expected_output")),
+                            result.get("output"),
+                            result.get("error"),
+                            result.get("diff"),
+                            json.dumps(result["benchmark"]) if result.get("benchmark") else None,
+                            json.dumps(result["profile"]) if result.get("profile") else None,
+                            json.dumps(comparator) if comparator else None,
+                        )
+                    ).lastrowid
+            # Results go with their run (ON DELETE CASCADE)
+            self.conn.execute(
+                "DELETE FROM runs WHERE kind = ? AND id NOT IN"
+                " (SELECT id FROM runs WHERE kind = ? ORDER BY id DESC LIMIT ?)",
+                (kind, kind, self.max_runs_per_kind)
+            )
+        return run_id
+
+    def query_results(
+        self,
+        filename: Optional[str] = None,
+        status: Optional[str] = None,
+        test_case: Optional[int] = None,
+        run_id: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[dict]:
+        clauses, params = [], []
+        for column, value in (("filename", filename), ("status", status), ("test_case", test_case), ("run_id", run_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = f"SELECT {', '.join(RESULT_COLUMNS)} FROM results"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [result_from_row(row) for row in rows]
+
+    def get_result(self, result_id: int) -> Optional[dict]:
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(RESULT_COLUMNS)} FROM results WHERE id = ?", (result_id,)
+            ).fetchone()
+        return result_from_row(row) if row else None
+
+    def rank_files(self, run_id: int) -> List[dict]:
+        """Per-file totals of one run, most CPU-efficient first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT filename, COUNT(*), SUM(status = 'PASS'), SUM(execution_time),"
+                " SUM(cpu_time), MAX(max_rss) FROM results WHERE run_id = ?"
+                " GROUP BY filename ORDER BY SUM(cpu_time) IS NULL, SUM(cpu_time), SUM(execution_time)",
+                (run_id,)
+            ).fetchall()
+        return [
+            {
+                "filename": filename,
+                "tests": tests,
+                "passed": passed,
+                "execution_time": execution_time,
+                "cpu_time": cpu_time,
+                "max_rss": max_rss,
+            }
+            for filename, tests, passed, execution_time, cpu_time, max_rss in rows
+        ]
+
+    def list_runs(self, limit: int = 20) -> List[dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, kind, use_common, created_at, stats FROM runs ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {
+                "id": run_id,
+                "kind": kind,
+                "use_common": bool(use_common),
+                "created_at": created_at,
+                "stats": json.loads(stats) if stats else None,
+            }
+            for run_id, kind, use_common, created_at, stats in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, List, Optional
+
+from batch import BatchRunner
+
+
+class EventLog:
+    """
+    Append-only log of events that SSE streams follow. Event ids are
+    positions in the log, so a client reconnecting with Last-Event-ID
+    resumes where it stopped. With max_events only the most recent events
+    are kept, and a client that fell further behind skips ahead.
+
+    Events are emitted from worker threads; streams wait for them on their
+    event loop, so an open stream does not hold a thread.
+    """
+
+    def __init__(self, max_events: Optional[int] = None):
+        self.events: List[dict] = []
+        self.first_index = 0  # log position of events[0]
+        self.max_events = max_events
+        self.condition = threading.Condition()
+        self.waiters = set()  # (loop, asyncio.Event) of the streams waiting for events
+
+    def _emit(self, event: dict):
+        with self.condition:
+            self.events.append(event)
+            if self.max_events is not None and len(self.events) > self.max_events:
+                dropped = len(self.events) - self.max_events
+                del self.events[:dropped]
+                self.first_index += dropped
+            waiters = list(self.waiters)
+        for loop, wakeup in waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # the loop has closed
+
+    async def stream(self, start: int = 0, keepalive: float = 15.0) -> AsyncIterator[str]:
+        """
+        Yields Server-Sent Events for the event log from index start on,
+        waiting until new events arrive, and stops after the "done" event.
+        """
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self.condition:
+            self.waiters.add(waiter)
+        try:
+            index = start
+            while True:
+                with self.condition:
+                    # Cleared under the lock: an event emitted after this
+                    # read sets it again
+                    wakeup.clear()
+                    index = max(index, self.first_index)
+                    pending = self.events[index - self.first_index:]
+                if not pending:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                    continue
+                for event in pending:
+                    index += 1
+                    yield f"id: {index}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    if event["type"] == "done":
+                        return
+        finally:
+            with self.condition:
+                self.waiters.discard(waiter)
+
+
+class BatchJob(EventLog):
+    """
+    A batch run executing in a background thread. Every finished test is
+    appended to an event log that pollers and SSE streams read from, so
+    results become visible while the rest of the batch is still running.
+    """
+
+    def __init__(
+        self,
+        runner: BatchRunner,
+        filenames: List[str],
+        config: dict,
+        use_common: bool,
+        on_done: Optional[Callable[[dict], None]] = None,
+    ):
+        super().__init__()
+        self.job_id = uuid.uuid4().hex
+        self.runner = runner
+        self.filenames = filenames
+        self.config = config
+        self.use_common = use_common
+        # Called with the finished /api/batch response before "done" is sent
+        self.on_done = on_done
+
+        self.status = "queued"  # queued, running, done, cancelled, error
+        self.error = None
+        self.created_at = time.time()
+        self.total = sum(
+            len(config.get("__COMMON__" if use_common else name, []))
+            for name in filenames
+            if os.path.exists(os.path.join(runner.work_dir, name))
+        )
+        self.completed = 0
+        self.response = None  # the /api/batch response once finished
+
+        self.cancel_event = threading.Event()
+
+    def start(self, slots: threading.Semaphore):
+        # "queued" until one of slots is free
+        thread = threading.Thread(target=self._run, args=(slots,))
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+        with self.condition:
+            queued = self.status == "queued"
+            if queued:
+                self.status = "cancelled"
+        if queued:
+            # Never started: done right away, its thread just exits
+            self._finish()
+
+    def _on_result(self, filename: str, result: dict):
+        with self.condition:
+            self.completed += 1
+        self._emit({"type": "result", "filename": filename, "result": result})
+
+    def _run(self, slots: threading.Semaphore):
+        with slots:
+            with self.condition:
+                if self.status != "queued":
+                    return  # cancelled while waiting for its turn
+                self.status = "running"
+            self._execute()
+
+    def _execute(self):
+        self._emit({"type": "status", "status": self.status, "total": self.total})
+        try:
+            self.response = self.runner.run(
+                self.filenames,
+                self.config,
+                use_common=self.use_common,
+                on_result=self._on_result,
+                cancel_event=self.cancel_event,
+            )
+            if self.on_done is not None:
+                self.on_done(self.response)
+            self.status = "cancelled" if self.cancel_event.is_set() else "done"
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e)
+        self._finish()
+
+    def _finish(self):
+        self._emit({
+            "type": "done",
+            "status": self.status,
+            "error": self.error,
+            "batch_results": self.response["batch_results"] if self.response else [],
+            "stats": self.response["stats"] if self.response else None,
+            "run_id": self.response.get("run_id") if self.response else None,
+        })
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "cancelled", "error")
+
+    def snapshot(self) -> dict:
+        # Partial results grouped per file, in completion order
+        partial = OrderedDict()
+        with self.condition:
+            for event in self.events:
+                if event["type"] == "result":
+                    partial.setdefault(event["filename"], []).append(event["result"])
+        data = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "total": self.total,
+            "completed": self.completed,
+        }
+        if self.response is not None:
+            data.update(self.response)
+        else:
+            data["batch_results"] = [
+                {"filename": name, "results": results}
+                for name, results in partial.items()
+            ]
+        return data
+
+
+class JobManager:
+    """
+    Keeps the most recent batch jobs in memory, keyed by job id.
+
+    Jobs run max_running at a time (each already runs its tests on a pool
+    of programs); later ones wait as "queued". Past max_waiting queued jobs,
+    submit() refuses new ones.
+    """
+
+    def __init__(self, max_jobs: int = 20, max_running: int = 1, max_waiting: int = 10):
+        self.max_jobs = max_jobs
+        self.max_waiting = max_waiting
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.running = threading.Semaphore(max_running)
+
+    def submit(
+        self,
+        runner: BatchRunner,
+        filenames: List[str],
+        config: dict,
+        use_common: bool,
+        on_done: Optional[Callable[[dict], None]] = None,
+    ) -> Optional[BatchJob]:
+        """The new job, or None if too many jobs are waiting already."""
+        job = BatchJob(runner, filenames, config, use_common, on_done)
+        with self.lock:
+            if sum(1 for other in self.jobs.values() if other.status == "queued") >= self.max_waiting:
+                return None
+            self.jobs[job.job_id] = job
+            # Forget the oldest finished jobs beyond the limit
+            for job_id in list(self.jobs):
+                if len(self.jobs) <= self.max_jobs:
+                    break
+                if self.jobs[job_id].finished:
+                    del self.jobs[job_id]
+        job.start(self.running)
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
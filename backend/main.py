@@ -1,15 +1,36 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
 import json
-from typing import List, Dict
-import glob
-from models import FileConfig, TestCase, ExecutionRequest, ExecutionResult, BatchExecutionRequest, GradingRequest, DirectoryRequest
+from typing import List, Dict, Optional
+from models import FileConfig, TestCase, ExecutionRequest, ExecutionResult, BatchExecutionRequest, GradingRequest, GradingBatchRequest, DirectoryRequest, WatchRequest
 from executor import Executor
-import difflib
+from async_executor import AsyncExecutor
+from batch import BatchRunner
+from distributed import DistributedBatchRunner, TaskQueue
+from benchmark import run_benchmark
+from comparators import compare
+from diffing import MAX_DIFF_OUTPUT_LINES, make_diff
+from forkserver import ForkServer
+from jobs import JobManager
+from watcher import WatchSession
+from directory_index import DirectoryIndex
+from result_cache import ResultCache
+from bytecode_cache import BytecodeCache
+from grading_store import GradingStore
+from sandbox import ResourceLimits
+import metrics
+import tracing
+import threading
+import atexit
+import asyncio
+import anyio
+import anyio.to_thread
 
 app = FastAPI()
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 # CORS configuration
 app.add_middleware(
@@ -18,6 +39,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by PDF viewers doing range requests
+    # X-Trace-Id names the trace of a request sent with X-Trace: 1
+    expose_headers=["Accept-Ranges", "Content-Range", "Content-Length", "ETag", "Last-Modified", "X-Trace-Id"],
 )
 
 # Configuration
@@ -29,28 +53,83 @@ if os.path.exists(dummy_dir):
 
 current_work_dir = DEFAULT_WORK_DIR
 
-def get_config_path():
-    return os.path.join(current_work_dir, "grading_config.json")
+# Optional fork server: set PROGRAM_CHECKER_FORK_SERVER=1 to run programs from
+# a warm, pre-forked interpreter instead of starting python for every test.
+fork_server = None
+if os.environ.get("PROGRAM_CHECKER_FORK_SERVER") == "1" and ForkServer.is_supported():
+    fork_server = ForkServer()
+    atexit.register(fork_server.stop)
 
-def load_config() -> Dict[str, List[TestCase]]:
-    config_file = get_config_path()
-    if not os.path.exists(config_file):
-        return {}
-    try:
-        with open(config_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data
-    except Exception:
-        return {}
+# Cache of program runs shared by all work directories (keyed by content hash)
+CACHE_DIR = os.environ.get(
+    "PROGRAM_CHECKER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".program_checker")
+)
+result_cache = ResultCache(os.path.join(CACHE_DIR, "result_cache.sqlite3"))
+# Compiled code of submissions, so a program isn't compiled again for every test
+bytecode_cache = BytecodeCache(os.path.join(CACHE_DIR, "bytecode"))
+
+# Chrome trace files of requests sent with "X-Trace: 1" or "?trace=1"
+TRACE_DIR = os.path.join(CACHE_DIR, "traces")
+app.add_middleware(tracing.TracingMiddleware, trace_dir=TRACE_DIR)
+
+# Optional sandbox: set PROGRAM_CHECKER_SANDBOX=1 to run programs under CPU,
+# memory, process, open file and file size limits (POSIX only).
+sandbox_limits = None
+if os.environ.get("PROGRAM_CHECKER_SANDBOX") == "1" and ResourceLimits.is_supported():
+    sandbox_limits = ResourceLimits()
+
+def make_executor(use_cache: bool = True) -> Executor:
+    return Executor(
+        fork_server=fork_server,
+        cache=result_cache if use_cache else None,
+        limits=sandbox_limits,
+        bytecode=bytecode_cache
+    )
+
+# Programs run at once by the async endpoints (PROGRAM_CHECKER_MAX_CONCURRENCY,
+# default: the CPU count). Blocking grading work (batches, benchmarks) runs in
+# its own threads, bounded the same way, so it never occupies the threadpool
+# that serves the other endpoints.
+MAX_CONCURRENCY = int(os.environ.get("PROGRAM_CHECKER_MAX_CONCURRENCY") or os.cpu_count() or 4)
+execution_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+grading_limiter = anyio.CapacityLimiter(MAX_CONCURRENCY)
+
+# Optional worker queue: set PROGRAM_CHECKER_QUEUE to a database path to have
+# batches graded by worker processes (python distributed.py PATH) instead of
+# a thread pool in this process.
+task_queue = None
+if os.environ.get("PROGRAM_CHECKER_QUEUE"):
+    task_queue = TaskQueue(os.environ["PROGRAM_CHECKER_QUEUE"])
+
+def make_runner(use_cache: bool = True, max_workers: Optional[int] = None, dedupe: bool = True) -> BatchRunner:
+    if task_queue is not None:
+        return DistributedBatchRunner(current_work_dir, make_executor(use_cache), task_queue, max_workers, dedupe)
+    return BatchRunner(current_work_dir, make_executor(use_cache), max_workers=max_workers, dedupe=dedupe)
+
+def make_async_executor(use_cache: bool = True) -> AsyncExecutor:
+    return AsyncExecutor(make_executor(use_cache), execution_slots, grading_limiter)
 
-def save_config(data: Dict[str, List[TestCase]]):
-    config_file = get_config_path()
-    with open(config_file, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+async def run_grading(func, *args):
+    # Long blocking grading work, in the bounded grading threads
+    return await anyio.to_thread.run_sync(func, *args, limiter=grading_limiter)
+
+# One test case / result database per work directory
+grading_stores: Dict[str, GradingStore] = {}
+grading_stores_lock = threading.Lock()
+
+def get_store() -> GradingStore:
+    with grading_stores_lock:
+        store = grading_stores.get(current_work_dir)
+        if store is None:
+            store = grading_stores[current_work_dir] = GradingStore(current_work_dir)
+        return store
+
+def load_config() -> Dict[str, List[TestCase]]:
+    return get_store().load()
 
 import subprocess
 import sys
-import threading
 import time
 
 # Global state for directory selection
@@ -149,207 +228,447 @@ def set_directory(request: DirectoryRequest):
     current_work_dir = request.path
     return {"status": "success", "path": current_work_dir}
 
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi import Header
+from text_files import TextFileCache, make_etag
+from pdf_files import ThumbnailCache, serve_file
+
+# Decoded source files, shared by all work directories (keyed by path)
+text_file_cache = TextFileCache()
+# First-page images of PDFs (optional: needs pypdfium2 or pdftoppm)
+pdf_thumbnails = ThumbnailCache(os.path.join(CACHE_DIR, "thumbnails"))
+
+# Cached listing of each work directory
+directory_indexes: Dict[str, DirectoryIndex] = {}
+directory_indexes_lock = threading.Lock()
+
+def get_directory_index() -> DirectoryIndex:
+    with directory_indexes_lock:
+        index = directory_indexes.get(current_work_dir)
+        if index is None:
+            index = directory_indexes[current_work_dir] = DirectoryIndex(current_work_dir)
+        return index
+
+def resolve_path(filename: str) -> str:
+    # Nested paths are allowed, but must stay inside the work directory
+    root = os.path.realpath(current_work_dir)
+    filepath = os.path.realpath(os.path.join(root, filename))
+    if os.path.commonpath([root, filepath]) != root:
+        raise HTTPException(status_code=400, detail="Invalid path")
+    return filepath
 
 @app.get("/api/files")
-def list_files(extension: str = "py"):
-    # List files with specific extension(s) in the current work directory
-    files = []
-    extensions = extension.split(",")
-    for ext in extensions:
-        search_pattern = os.path.join(current_work_dir, f"*.{ext.strip()}")
-        for file in glob.glob(search_pattern):
-            files.append(os.path.basename(file))
-    return {"files": sorted(files)}
-
-@app.get("/api/files/{filename}")
-def get_file_content(filename: str):
-    filepath = os.path.join(current_work_dir, filename)
+def list_files(
+    extension: str = "py",
+    recursive: bool = False,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    with_hash: bool = False,
+    refresh: bool = False
+):
+    # List files with specific extension(s) in the current work directory,
+    # or below it with recursive=true (names are then relative paths)
+    entries = get_directory_index().list(extension.split(","), recursive, refresh)
+    page = entries[offset:offset + limit if limit is not None else None]
+    if with_hash:
+        index = get_directory_index()
+        page = [{**entry, "hash": index.content_hash(entry["name"])} for entry in page]
+    # Plain JSON values already; skipping jsonable_encoder matters for thousands of entries
+    return JSONResponse({
+        "files": [entry["name"] for entry in page],
+        "entries": page,
+        "total": len(entries),
+        "offset": offset,
+        "limit": limit,
+    })
+
+@app.get("/api/files/{filename:path}")
+def get_file_content(filename: str, if_none_match: Optional[str] = Header(None)):
+    filepath = resolve_path(filename)
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Revalidation only needs a stat, not a read
+    etag = make_etag(stat)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    decoded = text_file_cache.get(filepath, stat)
+    return JSONResponse({"content": decoded.text, "encoding": decoded.encoding}, headers=headers)
+
+@app.get("/api/pdf-thumbnails/{filename:path}")
+def get_pdf_thumbnail(filename: str, request: Request, width: int = 160):
+    # PNG of the first page, rendered once per PDF content and width
+    filepath = resolve_path(filename)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
-    
+    if not filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Not a PDF file")
+    if not ThumbnailCache.is_supported():
+        raise HTTPException(status_code=501, detail="Thumbnails need pypdfium2 or pdftoppm")
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        # Fallback to Shift-JIS (cp932) for Windows environment
-        try:
-            with open(filepath, "r", encoding="cp932") as f:
-                content = f.read()
-        except Exception:
-             # If both fail, return empty or error message (or handle binary)
-             content = "Error: Unable to decode file content."
-    
-    return {"content": content}
+        thumbnail = pdf_thumbnails.get(filepath, max(16, min(width, 1024)))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Could not render PDF: {e}")
+    return serve_file(thumbnail, "image/png", request.headers)
 
-@app.get("/api/pdfs/{filename}")
-def get_pdf_content(filename: str):
-    filepath = os.path.join(current_work_dir, filename)
+@app.get("/api/pdfs/{filename:path}")
+def get_pdf_content(filename: str, request: Request):
+    filepath = resolve_path(filename)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
     if not filename.lower().endswith(".pdf"):
          raise HTTPException(status_code=400, detail="Not a PDF file")
-         
-    return FileResponse(filepath, media_type="application/pdf")
 
-@app.get("/api/config/{filename}")
+    # Range requests let the viewer load large PDFs progressively
+    return serve_file(filepath, "application/pdf", request.headers)
+
+@app.get("/api/config/{filename:path}")
 def get_file_config(filename: str):
-    config = load_config()
-    return {"test_cases": config.get(filename, [])}
+    return {"test_cases": get_store().get(filename)}
 
-@app.post("/api/config/{filename}")
+@app.post("/api/config/{filename:path}")
 def update_file_config(filename: str, test_cases: List[TestCase]):
-    config = load_config()
-    config[filename] = [tc.model_dump() for tc in test_cases]
-    save_config(config)
+    get_store().set(filename, [tc.model_dump() for tc in test_cases])
     return {"status": "success"}
 
+def record_single_result(kind: str, result: ExecutionResult, input_data: str, comparator: Optional[dict] = None):
+    entry = {"filename": result.filename, "results": [{
+        "status": result.status,
+        "execution_time": result.execution_time,
+        "cpu_time": result.cpu_time,
+        "user_time": result.user_time,
+        "sys_time": result.sys_time,
+        "max_rss": result.max_rss,
+        "input_data": input_data,
+        "expected_output": result.expected_output,
+        "output": result.output,
+        "error": result.error,
+        "diff": result.diff,
+        "benchmark": result.benchmark,
+        "profile": result.profile,
+        "comparator": comparator,
+    }]}
+    get_store().record_run(kind, [entry])
+    result.result_id = entry["results"][0]["result_id"]
+    metrics.TEST_RESULTS.inc(status=result.status)
+
 @app.post("/api/run", response_model=ExecutionResult)
-def run_code(request: ExecutionRequest):
+async def run_code(request: ExecutionRequest):
     filepath = os.path.join(current_work_dir, request.filename)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
 
-    executor = Executor()
-    stdout, stderr, exec_time, is_timeout = executor.run(filepath, request.input_data)
+    executor = make_async_executor(request.use_cache)
+    profile = request.profile.model_dump() if request.profile else None
+    run = await executor.run(filepath, request.input_data, profile=profile)
     
     status = "PASS"
-    if is_timeout:
+    if run.is_timeout:
         status = "TIMEOUT"
-    elif stderr:
+    elif run.limit:
+        status = run.limit
+    elif run.stderr:
         status = "ERROR"
 
-    return ExecutionResult(
+    result = ExecutionResult(
         filename=request.filename,
         status=status,
-        output=stdout,
-        error=stderr,
-        execution_time=exec_time
+        output=run.stdout,
+        error=run.stderr,
+        execution_time=run.execution_time,
+        cpu_time=run.cpu_time,
+        user_time=run.user_time,
+        sys_time=run.sys_time,
+        max_rss=run.max_rss,
+        profile=run.profile
     )
+    with tracing.span("record_result"):
+        await run_in_threadpool(record_single_result, "run", result, request.input_data)
+    return result
+
+def check_output(expected: str, actual: str, comparator: Optional[dict]):
+    # (mismatch, diff); the diff is size-capped, same as /api/results/{id}/diff
+    mismatch = compare(expected, actual, comparator)
+    if mismatch is None:
+        return None, None
+    return mismatch, make_diff(expected, actual)["diff"]
 
 @app.post("/api/grade", response_model=ExecutionResult)
-def grade_code(request: GradingRequest):
+async def grade_code(request: GradingRequest):
     filepath = os.path.join(current_work_dir, request.filename)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
 
-    executor = Executor()
-    stdout, stderr, exec_time, is_timeout = executor.run(filepath, request.input_data)
+    executor = make_async_executor(request.use_cache)
+    profile = request.profile.model_dump() if request.profile else None
+    run = await executor.run(filepath, request.input_data, profile=profile)
     
     status = "PASS"
     diff = None
-    
-    if is_timeout:
+    mismatch = None
+    comparator = request.comparator.model_dump() if request.comparator else None
+
+    if run.is_timeout:
         status = "TIMEOUT"
-    elif stderr:
+    elif run.limit:
+        status = run.limit
+    elif run.stderr:
         status = "ERROR"
     else:
         if request.run_only:
             status = "PASS"
         else:
-            actual = stdout.strip().replace("\r\n", "\n")
-            expected = request.expected_output.strip().replace("\r\n", "\n")
-            
-            if actual != expected:
+            # Outputs can be megabytes; compare them off the event loop
+            mismatch, diff = await run_in_threadpool(check_output, request.expected_output, run.stdout, comparator)
+            if mismatch is not None:
                 status = "FAIL"
-                diff = "\n".join(difflib.unified_diff(
-                    expected.splitlines(), 
-                    actual.splitlines(), 
-                    fromfile='Expected', 
-                    tofile='Actual',
-                    lineterm=''
-                ))
-
-    return ExecutionResult(
+
+    benchmark = None
+    if request.benchmark is not None and status == "PASS":
+        # Repeated timed runs; one program at a time, like in batches
+        async with execution_slots:
+            with tracing.span("benchmark"):
+                status, benchmark = await run_grading(
+                    run_benchmark, executor.executor, filepath, request.input_data, request.benchmark.model_dump()
+                )
+
+    result = ExecutionResult(
         filename=request.filename,
         status=status,
-        output=stdout,
-        error=stderr,
-        execution_time=exec_time,
+        output=run.stdout,
+        error=run.stderr,
+        execution_time=run.execution_time,
+        cpu_time=run.cpu_time,
+        user_time=run.user_time,
+        sys_time=run.sys_time,
+        max_rss=run.max_rss,
         expected_output=request.expected_output,
-        diff=diff
+        diff=diff,
+        mismatch=mismatch,
+        benchmark=benchmark,
+        profile=run.profile
     )
+    with tracing.span("record_result"):
+        await run_in_threadpool(record_single_result, "grade", result, request.input_data, comparator)
+    return result
+
+@app.post("/api/grade/batch")
+async def grade_code_batch(request: GradingBatchRequest):
+    # All test cases of one file in one request, run concurrently; results
+    # come back in test case order (diffs via /api/results/{id}/diff)
+    filepath = os.path.join(current_work_dir, request.filename)
+    if not os.path.exists(filepath):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    config = {request.filename: [tc.model_dump() for tc in request.test_cases]}
+    runner = make_runner(request.use_cache, request.max_workers)
+    response = await run_grading(runner.run, [request.filename], config)
+    with tracing.span("record_run"):
+        run_id = await run_in_threadpool(
+            lambda: get_store().record_run("grade", response["batch_results"], stats=response["stats"], config=config)
+        )
+    entry = response["batch_results"][0]
+    with tracing.span("serialize_response"):
+        return JSONResponse({
+            "filename": request.filename,
+            "results": entry.get("results", []),
+            "summary": entry.get("summary"),
+            "stats": response["stats"],
+            "run_id": run_id,
+        })
 
 @app.post("/api/batch")
-def batch_run(request: BatchExecutionRequest):
-    config = load_config()
-    results = []
-    
-    common_tests = []
-    if request.use_common:
-        common_tests = config.get("__COMMON__", [])
-    
-    for filename in request.filenames:
+async def batch_run(request: BatchExecutionRequest):
+    store = get_store()
+    runner = make_runner(request.use_cache, request.max_workers, request.dedupe)
+
+    def run():
+        with tracing.span("load_config"):
+            config = store.load()
+        response = runner.run(request.filenames, config, use_common=request.use_common)
+        with tracing.span("record_run"):
+            response["run_id"] = store.record_run(
+                "batch", response["batch_results"], request.use_common, response["stats"], config
+            )
+        return response
+
+    response = await run_grading(run)
+    # Serialized here rather than by FastAPI so a trace shows its cost
+    with tracing.span("serialize_response"):
+        return JSONResponse(response)
+
+@app.get("/api/workers")
+def list_workers():
+    # Queue workers and their throughput (empty without PROGRAM_CHECKER_QUEUE)
+    if task_queue is None:
+        return {"queue": None, "pending": 0, "workers": []}
+    return {"queue": task_queue.path, "pending": task_queue.pending_count(), "workers": task_queue.workers()}
+
+@app.get("/api/runs")
+def list_runs(limit: int = 20):
+    return {"runs": get_store().list_runs(limit)}
+
+@app.get("/api/runs/{run_id}/ranking")
+def rank_run(run_id: int):
+    # Files of one run ordered by total CPU time, to compare efficiency
+    return {"ranking": get_store().rank_files(run_id)}
+
+@app.get("/api/results")
+def query_results(
+    filename: Optional[str] = None,
+    status: Optional[str] = None,
+    test_case: Optional[int] = None,
+    run_id: Optional[int] = None,
+    limit: int = 100
+):
+    # e.g. /api/results?status=FAIL&test_case=3 without rerunning anything
+    return {"results": get_store().query_results(filename, status, test_case, run_id, limit)}
+
+@app.get("/api/results/{result_id}")
+def get_result(result_id: int):
+    result = get_store().get_result(result_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return result
+
+@app.get("/api/results/{result_id}/diff")
+def get_result_diff(result_id: int, context: int = 3, max_lines: int = MAX_DIFF_OUTPUT_LINES):
+    # Built on demand so batch responses don't carry a diff per failed test
+    result = get_store().get_result(result_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    expected = result["expected_output"] or ""
+    actual = result["output"] or ""
+    diff = make_diff(expected, actual, context, max_lines)
+    # Judged with the comparator the test was graded with
+    return {"result_id": result_id, "mismatch": compare(expected, actual, result["comparator"]), **diff}
+
+@app.get("/metrics")
+def get_metrics():
+    # Prometheus text format
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/traces")
+def list_traces():
+    # Newest first; open one in chrome://tracing or ui.perfetto.dev
+    return {"directory": TRACE_DIR, "traces": tracing.list_traces(TRACE_DIR)}
+
+@app.get("/api/traces/{trace_id}")
+def get_trace(trace_id: str):
+    path = tracing.trace_path(TRACE_DIR, trace_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FileResponse(path, media_type="application/json", filename=f"trace-{trace_id}.json")
+
+@app.get("/api/cache")
+def get_cache_stats():
+    return result_cache.stats()
+
+@app.delete("/api/cache")
+def invalidate_cache(filename: Optional[str] = None):
+    # Drops every cached run, or only the runs of one file in the work directory
+    filepath = None
+    if filename:
         filepath = os.path.join(current_work_dir, filename)
         if not os.path.exists(filepath):
-            results.append({
-                "filename": filename,
-                "status": "NOT_FOUND",
-                "details": "File not found"
-            })
-            continue
-            
-        if request.use_common:
-            test_cases = common_tests
-        else:
-            test_cases = config.get(filename, [])
-            
-        if not test_cases:
-            results.append({
-                "filename": filename,
-                "status": "NO_TESTS",
-                "details": "No test cases defined"
-            })
-            continue
-            
-        file_results = []
-        executor = Executor()
-        
-        for i, tc in enumerate(test_cases):
-            # tc is a dict here because of json load
-            input_data = tc.get("input_data", "")
-            expected_output = tc.get("expected_output", "")
-            run_only = tc.get("run_only", False)
-            
-            stdout, stderr, exec_time, is_timeout = executor.run(filepath, input_data)
-            
-            status = "PASS"
-            if is_timeout:
-                status = "TIMEOUT"
-            elif stderr:
-                status = "ERROR"
-            else:
-                if not run_only:
-                    actual = stdout.strip().replace("\r\n", "\n")
-                    expected = expected_output.strip().replace("\r\n", "\n")
-                    if actual != expected:
-                        status = "FAIL"
-            
-            diff = None
-            if status == "FAIL":
-                 diff = "\n".join(difflib.unified_diff(
-                    expected.splitlines(), 
-                    actual.splitlines(), 
-                    fromfile='Expected', 
-                    tofile='Actual',
-                    lineterm=''
-                ))
-
-            file_results.append({
-                "test_case": i + 1,
-                "status": status,
-                "execution_time": exec_time,
-                "output": stdout,
-                "error": stderr,
-                "diff": diff
-            })
-            
-        results.append({
-            "filename": filename,
-            "results": file_results
-        })
-        
-    return {"batch_results": results}
+            raise HTTPException(status_code=404, detail="File not found")
+    removed = result_cache.invalidate(filepath)
+    return {"status": "success", "removed": removed}
+
+job_manager = JobManager()
+
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/jobs")
+def submit_batch_job(request: BatchExecutionRequest):
+    store = get_store()
+    config = store.load()
+    # Jobs run one at a time, each with at most MAX_CONCURRENCY programs
+    max_workers = min(request.max_workers or MAX_CONCURRENCY, MAX_CONCURRENCY)
+    runner = make_runner(request.use_cache, max_workers, request.dedupe)
+
+    def record(response: dict):
+        response["run_id"] = store.record_run(
+            "batch", response["batch_results"], request.use_common, response["stats"], config
+        )
+
+    job = job_manager.submit(runner, request.filenames, config, request.use_common, on_done=record)
+    if job is None:
+        raise HTTPException(status_code=429, detail="Too many batch jobs are waiting")
+    return {"job_id": job.job_id, "status": job.status, "total": job.total}
+
+@app.get("/api/jobs/{job_id}")
+def get_batch_job(job_id: str):
+    return get_job(job_id).snapshot()
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_batch_job(job_id: str):
+    job = get_job(job_id)
+    job.cancel()
+    return {"job_id": job.job_id, "status": job.status}
+
+@app.get("/api/jobs/{job_id}/events")
+def stream_batch_job(job_id: str, last_event_id: Optional[str] = Header(None)):
+    # Server-Sent Events; EventSource resumes with Last-Event-ID after a reconnect
+    job = get_job(job_id)
+    start = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    return StreamingResponse(
+        job.stream(start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+# Watch mode: at most one session per work directory
+watch_sessions: Dict[str, WatchSession] = {}
+watch_sessions_lock = threading.Lock()
+
+def get_watch() -> WatchSession:
+    with watch_sessions_lock:
+        session = watch_sessions.get(current_work_dir)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Watch mode is not running")
+    return session
+
+@app.post("/api/watch")
+def start_watch(request: WatchRequest):
+    # Regrades changed files and edited test cases of the current directory
+    with watch_sessions_lock:
+        session = watch_sessions.get(current_work_dir)
+        if session is not None and not session.stop_event.is_set():
+            return session.status()
+        runner = make_runner(request.use_cache, request.max_workers)
+        session = WatchSession(runner, get_store(), request.use_common, request.interval)
+        watch_sessions[current_work_dir] = session
+    session.start()
+    return session.status()
+
+@app.get("/api/watch")
+def get_watch_status():
+    return get_watch().status()
+
+@app.delete("/api/watch")
+def stop_watch():
+    session = get_watch()
+    session.stop()
+    return session.status()
+
+@app.get("/api/watch/events")
+def stream_watch(last_event_id: Optional[str] = Header(None)):
+    session = get_watch()
+    start = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    return StreamingResponse(
+        session.stream(start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,10 +1,30 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
+
+class BenchmarkConfig(BaseModel):
+    repeats: int = 5  # timed runs
+    warmup: int = 1  # untimed runs before them
+    reference: Optional[str] = None  # reference solution in the same directory
+    max_slowdown: float = 2.0  # TOO_SLOW beyond this multiple of the reference median
+    metric: str = "cpu_time"  # or "execution_time" (wall clock)
+
+class ComparatorConfig(BaseModel):
+    # How output is compared with expected_output, see comparators.py
+    type: Literal["exact", "tokens", "float", "regex", "unordered_lines"] = "exact"
+    abs_tol: float = 1e-6  # float only
+    rel_tol: float = 1e-6  # float only
+
+class ProfileConfig(BaseModel):
+    # Profile mode of /api/run and /api/grade, see profile_runner.py
+    top: int = 20  # hot functions / allocation sites reported
+    memory: bool = False  # also trace allocations (tracemalloc; slower)
 
 class TestCase(BaseModel):
     input_data: str
     expected_output: str
     run_only: bool = False
+    comparator: Optional[ComparatorConfig] = None  # exact comparison when unset
+    benchmark: Optional[BenchmarkConfig] = None  # performance grading when set
 
 class FileConfig(BaseModel):
     filename: str
@@ -13,25 +33,55 @@ class FileConfig(BaseModel):
 class ExecutionRequest(BaseModel):
     filename: str
     input_data: str
+    use_cache: bool = True
+    profile: Optional[ProfileConfig] = None  # run under cProfile when set
 
 class ExecutionResult(BaseModel):
     filename: str
-    status: str  # "PASS", "FAIL", "TIMEOUT", "ERROR"
+    status: str  # "PASS", "FAIL", "TIMEOUT", "ERROR", "OUTPUT_LIMIT", "CPU_LIMIT", "MEMORY_LIMIT", "TOO_SLOW"
     output: str
     error: str
     execution_time: float
+    # Resource usage of the program; None where the platform can't measure it
+    cpu_time: Optional[float] = None  # user + sys seconds
+    user_time: Optional[float] = None
+    sys_time: Optional[float] = None
+    max_rss: Optional[int] = None  # peak resident set size in bytes
     expected_output: Optional[str] = None
-    diff: Optional[str] = None
+    diff: Optional[str] = None  # capped for large outputs
+    mismatch: Optional[dict] = None  # first differing line: {"line", "expected", "actual"}
+    benchmark: Optional[dict] = None  # repeated timings, see benchmark.run_benchmark
+    profile: Optional[dict] = None  # hot functions and allocation sites, see profile_runner.py
+    result_id: Optional[int] = None  # row in the work directory's grading.sqlite3
 
 class BatchExecutionRequest(BaseModel):
     filenames: List[str]
     use_common: bool = False
+    max_workers: Optional[int] = None  # defaults to the CPU count
+    use_cache: bool = True
+    dedupe: bool = True  # run identical (program, input) pairs once
+
+class WatchRequest(BaseModel):
+    use_common: bool = False
+    max_workers: Optional[int] = None
+    use_cache: bool = True
+    interval: float = 1.0  # polling interval where inotify is unavailable
 
 class GradingRequest(BaseModel):
     filename: str
     input_data: str
     expected_output: str
     run_only: bool = False
+    comparator: Optional[ComparatorConfig] = None
+    benchmark: Optional[BenchmarkConfig] = None
+    use_cache: bool = True
+    profile: Optional[ProfileConfig] = None  # run under cProfile when set
+
+class GradingBatchRequest(BaseModel):
+    filename: str
+    test_cases: List[TestCase]
+    max_workers: Optional[int] = None  # defaults to the CPU count
+    use_cache: bool = True
 
 class DirectoryRequest(BaseModel):
     path: str
@@ -0,0 +1,213 @@
+"""
+Serving of large files (PDF specs) with HTTP caching and byte ranges, and
+cached first-page thumbnails.
+
+Thumbnails need pypdfium2 (with Pillow) or poppler's pdftoppm on PATH;
+without either, ThumbnailCache.is_supported() is False.
+"""
+import email.utils
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import pypdfium2
+    import PIL.Image  # noqa: F401 - needed by pypdfium2's to_pil()
+except ImportError:
+    pypdfium2 = None
+
+CHUNK_BYTES = 256 * 1024
+
+
+class ContentHashes:
+    """sha256 of files, computed once per (path, mtime, size)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hashes: Dict[str, Tuple[tuple, str]] = {}
+
+    def get(self, filepath: str, stat: os.stat_result) -> str:
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.hashes.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.hashes[filepath] = (signature, digest.hexdigest())
+        return digest.hexdigest()
+
+
+content_hashes = ContentHashes()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (first, last) byte of a single "bytes=" range, inclusive. None for
+    headers we answer with the whole file (other units, multiple ranges).
+    Raises ValueError when the range can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError("empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError("malformed range")
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _read_chunks(filepath: str, start: int, length: int) -> Iterator[bytes]:
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_BYTES, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = email.utils.parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return True
+    return int(mtime) > since
+
+
+def serve_file(filepath: str, media_type: str, request_headers: Mapping[str, str]) -> Response:
+    """
+    The file with a strong ETag (content hash) and Last-Modified, answering
+    If-None-Match / If-Modified-Since with 304 and a Range header (honouring
+    If-Range) with 206 Partial Content.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+    size = stat.st_size
+    etag = f'"{content_hashes.get(filepath, stat)}"'
+    last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+    elif "if-modified-since" in request_headers:
+        if not _modified_since(request_headers["if-modified-since"], stat.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    # A stale If-Range means the client's partial copy is outdated: send everything
+    if range_header and (if_range is None or if_range.strip() in (etag, last_modified)):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        return StreamingResponse(
+            _read_chunks(filepath, 0, size),
+            media_type=media_type,
+            headers={**headers, "Content-Length": str(size)},
+        )
+    start, end = byte_range
+    return StreamingResponse(
+        _read_chunks(filepath, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            **headers,
+            "Content-Length": str(end - start + 1),
+            "Content-Range": f"bytes {start}-{end}/{size}",
+        },
+    )
+
+
+def _render_pdfium(pdf_path: str, width: int) -> bytes:
+    document = pypdfium2.PdfDocument(pdf_path)
+    try:
+        page = document[0]
+        image = page.render(scale=width / page.get_width()).to_pil()
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    finally:
+        document.close()
+
+
+def _render_pdftoppm(pdf_path: str, width: int) -> bytes:
+    with tempfile.TemporaryDirectory() as tmp:
+        prefix = os.path.join(tmp, "page")
+        subprocess.run(
+            ["pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile",
+             "-scale-to-x", str(width), "-scale-to-y", "-1", pdf_path, prefix],
+            check=True, capture_output=True, timeout=30
+        )
+        with open(prefix + ".png", "rb") as f:
+            return f.read()
+
+
+class ThumbnailCache:
+    """
+    PNG images of the first page of PDFs, stored under cache_dir by content
+    hash and width, so a file is rendered once however often it is listed
+    (and shared between byte-identical copies).
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def is_supported() -> bool:
+        return pypdfium2 is not None or shutil.which("pdftoppm") is not None
+
+    def get(self, pdf_path: str, width: int) -> str:
+        """Path of the cached thumbnail, rendering it first if needed."""
+        digest = content_hashes.get(pdf_path, os.stat(pdf_path))
+        path = os.path.join(self.cache_dir, f"{digest}-{width}.png")
+        if os.path.exists(path):
+            return path
+        if pypdfium2 is not None:
+            data = _render_pdfium(pdf_path, width)
+        else:
+            data = _render_pdftoppm(pdf_path, width)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write then rename, so a concurrent reader never sees half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
@@ -0,0 +1,216 @@
+"""
+Runs a submission under cProfile (and optionally tracemalloc) for the
+profile mode of /api/run and /api/grade. The executor starts it as
+
+    python profile_runner.py REPORT_PATH TOP MEMORY BUDGET SCRIPT
+
+instead of "python SCRIPT". The program runs as __main__ and keeps its
+stdin, stdout, stderr, working directory and exit status; the report is written to REPORT_PATH
+as JSON:
+
+- functions: the TOP functions by own (self) time, with call counts and
+  cumulative time
+- memory (MEMORY=1): peak traced bytes and the TOP allocation sites
+  (file, line) of the largest heap snapshot taken while the program ran.
+  Snapshots are sampled whenever the heap has grown by a tenth since the
+  last one, so the sites are those live near the peak.
+
+A program still running after BUDGET seconds (a little under the
+timeout; 0 for none) gets its report written then, marked "partial",
+so slow programs that time out can still be profiled.
+
+Resource limits in PROGRAM_CHECKER_LIMITS are applied before the program
+runs (see sandbox.py).
+
+Only the standard library is imported here, so the submission's own
+modules (e.g. a models.py next to it) are not shadowed by the backend's.
+"""
+import cProfile
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import types
+
+# Seconds between heap size checks while tracing allocations
+SAMPLE_INTERVAL = 0.01
+# Heap growth since the last snapshot that triggers a new one
+SNAPSHOT_GROWTH = 1.1
+# Frames kept per allocation (only the innermost is reported)
+TRACE_FRAMES = 1
+
+# Our own frames, hidden from reports and tracebacks
+_INTERNAL_FILES = {os.path.abspath(__file__), tracemalloc.__file__, threading.__file__}
+
+
+def _is_internal(filename: str, name: str, callers: dict) -> bool:
+    if filename in _INTERNAL_FILES or name == "<method 'disable' of '_lsprof.Profiler' objects>":
+        return True
+    # Built-ins ("~") called from here, e.g. exec of the script (whose caller
+    # started before profiling and so is not recorded)
+    return filename == "~" and all(caller[0] in _INTERNAL_FILES for caller in callers)
+
+
+def _display_path(filename: str, script_dir: str) -> str:
+    if filename.startswith(script_dir + os.sep):
+        return os.path.relpath(filename, script_dir)
+    return filename
+
+
+class PeakSampler(threading.Thread):
+    """Keeps the heap snapshot taken closest to the peak of traced memory."""
+
+    def __init__(self):
+        super().__init__(name="profile-peak-sampler", daemon=True)
+        self.stopped = threading.Event()
+        self.snapshot = None
+        self.snapshot_size = 0
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            self.sample()
+
+    def sample(self):
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.snapshot_size * SNAPSHOT_GROWTH:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = current
+
+    def stop(self):
+        self.stopped.set()
+        self.sample()
+
+
+class Report:
+    def __init__(self, path: str, top: int, script: str, profiler: cProfile.Profile, sampler):
+        self.path = path
+        self.top = top
+        self.script_dir = os.path.dirname(os.path.abspath(script))
+        self.profiler = profiler
+        self.sampler = sampler
+        self.start_time = time.perf_counter()
+        self.written = False
+
+    def hot_functions(self) -> list:
+        self.profiler.create_stats()
+        functions = []
+        for (filename, line, name), (primitive_calls, calls, self_time, total_time, callers) in self.profiler.stats.items():
+            if _is_internal(filename, name, callers):
+                continue
+            functions.append({
+                "function": name,
+                "file": _display_path(filename, self.script_dir),
+                "line": line,
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "self_time": self_time,
+                "total_time": total_time,
+            })
+        functions.sort(key=lambda entry: entry["self_time"], reverse=True)
+        return functions[:self.top]
+
+    def allocation_sites(self) -> dict:
+        _, peak = tracemalloc.get_traced_memory()
+        self.sampler.stop()
+        snapshot = self.sampler.snapshot
+        sites = []
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, name) for name in _INTERNAL_FILES])
+            for stat in snapshot.statistics("lineno")[:self.top]:
+                frame = stat.traceback[0]
+                sites.append({
+                    "file": _display_path(frame.filename, self.script_dir),
+                    "line": frame.lineno,
+                    "size": stat.size,
+                    "count": stat.count,
+                })
+        return {"peak_bytes": peak, "snapshot_bytes": self.sampler.snapshot_size, "sites": sites}
+
+    def write(self, partial: bool = False):
+        if self.written:
+            return
+        self.written = True
+        self.profiler.disable()
+        report = {
+            "partial": partial,
+            "wall_time": time.perf_counter() - self.start_time,
+            "functions": self.hot_functions(),
+            "memory": None,
+        }
+        if self.sampler is not None:
+            report["memory"] = self.allocation_sites()
+            tracemalloc.stop()
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+
+
+def _print_exception(error: BaseException):
+    # The traceback a plain "python SCRIPT" would print, without our frames
+    tb = error.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename in _INTERNAL_FILES:
+        tb = tb.tb_next
+    traceback.print_exception(type(error), error, tb)
+
+
+def apply_limits():
+    if os.environ.get("PROGRAM_CHECKER_LIMITS"):
+        import sandbox
+        sandbox.apply_env_limits()
+        # The submission may have a sandbox.py of its own
+        del sys.modules["sandbox"]
+
+
+def main():
+    apply_limits()
+    report_path, top, memory, budget, script = sys.argv[1:6]
+    script = os.path.abspath(script)
+    sys.argv = [script] + sys.argv[6:]
+    sys.path[0] = os.path.dirname(script)
+
+    sampler = None
+    if memory == "1":
+        tracemalloc.start(TRACE_FRAMES)
+        sampler = PeakSampler()
+        try:
+            sampler.start()
+        except RuntimeError:
+            pass  # no thread under the sandbox's process limit; one snapshot at the end
+    profiler = cProfile.Profile()
+    report = Report(report_path, int(top), script, profiler, sampler)
+
+    if float(budget) > 0 and hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, lambda signum, frame: report.write(partial=True))
+        signal.setitimer(signal.ITIMER_REAL, float(budget))
+
+    # What "python SCRIPT" does: the script runs as a fresh __main__ module
+    module = types.ModuleType("__main__")
+    module.__file__ = script
+    module.__builtins__ = __builtins__
+    sys.modules["__main__"] = module
+    try:
+        with open(script, "rb") as f:
+            code = compile(f.read(), script, "exec")
+    except (OSError, SyntaxError) as e:
+        report.write()
+        _print_exception(e)
+        sys.exit(1)
+
+    profiler.enable()
+    try:
+        exec(code, module.__dict__)
+    except SystemExit:
+        report.write()
+        raise
+    except BaseException as e:
+        report.write()
+        _print_exception(e)
+        sys.exit(1)
+    report.write()
+
+
+if __name__ == "__main__":
+    main()
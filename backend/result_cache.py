@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+
+from executor import RunResult
+
+# Bump when the stored layout changes; older caches are simply dropped
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    source_hash TEXT NOT NULL,
+    stdout TEXT NOT NULL,
+    stderr TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE INDEX IF NOT EXISTS results_source_hash ON results (source_hash);
+"""
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent cache of raw program runs, keyed by
+    (source hash, input hash, interpreter, timeout and limits).
+
+    Only the program's stdout/stderr are stored; PASS/FAIL is always
+    recomputed by the caller, so editing an expected output never needs a
+    new execution. Entries are evicted least-recently-used once the stored
+    output exceeds max_bytes. Timeouts and runs killed by a limit are not
+    cached since they depend on how loaded the machine was.
+
+    Note that only the submitted file itself is hashed: a program that reads
+    other files or is nondeterministic should be run with the cache disabled.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.interpreter = f"{sys.executable}|{sys.version}"
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS results")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(SCHEMA)
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+        # filepath -> ((mtime_ns, size), sha256) so sources are hashed once per change
+        self.source_hashes = {}
+
+    def source_hash(self, filepath: str) -> str:
+        stat = os.stat(filepath)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self.source_hashes.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(filepath, "rb") as f:
+            digest = hash_bytes(f.read())
+        self.source_hashes[filepath] = (signature, digest)
+        return digest
+
+    def make_key(self, filepath: str, input_data: str, settings) -> str:
+        # settings: anything else that changes the outcome (timeout, limits)
+        parts = [
+            self.source_hash(filepath),
+            hash_bytes(input_data.encode("utf-8")),
+            self.interpreter,
+            repr(settings),
+        ]
+        return hash_bytes("\0".join(parts).encode("utf-8"))
+
+    def get(self, key: str) -> Optional[RunResult]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT stdout, stderr, meta FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        stdout, stderr, meta = row
+        return RunResult(stdout=stdout, stderr=stderr, **json.loads(meta))
+
+    def put(self, key: str, filepath: str, result: RunResult):
+        if result.is_timeout or result.limit:
+            return
+        meta = result._asdict()
+        stdout = meta.pop("stdout")
+        stderr = meta.pop("stderr")
+        size = len(stdout) + len(stderr)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, self.source_hash(filepath), stdout, stderr, json.dumps(meta), size, time.time())
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Drop least recently used entries until we are back under the limit
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM results ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def invalidate(self, filepath: Optional[str] = None) -> int:
+        """
+        Removes all entries, or only those for the current contents of
+        filepath (shared with byte-identical files). Returns the count.
+        """
+        source_hash = self.source_hash(filepath) if filepath is not None else None
+        with self.lock:
+            if source_hash is None:
+                cursor = self.conn.execute("DELETE FROM results")
+                self.source_hashes.clear()
+            else:
+                cursor = self.conn.execute("DELETE FROM results WHERE source_hash = ?", (source_hash,))
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            self.conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {
+            "entries": entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,111 @@
+"""
+Resource limits for student programs (POSIX only).
+
+ResourceLimits.apply() runs in the child right before the program starts:
+in the forked child of forkserver.py, or in bytecode_runner.py /
+profile_runner.py, which get the limits in the PROGRAM_CHECKER_LIMITS
+environment variable (a Popen preexec_fn would run Python code between
+fork and exec, which can deadlock in our multi-threaded backend).
+classify_limit() turns the way a program ended into CPU_LIMIT /
+MEMORY_LIMIT / OUTPUT_LIMIT.
+
+Only the standard library is imported here, as the runners load this file.
+"""
+import os
+import signal
+import sys
+from typing import NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Environment variable the runners read the limits from
+LIMITS_ENV = "PROGRAM_CHECKER_LIMITS"
+
+
+class ResourceLimits(NamedTuple):
+    cpu_seconds: Optional[int] = 5
+    memory_bytes: Optional[int] = 1024 * 1024 * 1024  # address space
+    # RLIMIT_NPROC counts every process of the user, not just the program's
+    max_processes: Optional[int] = 256
+    max_open_files: Optional[int] = 256
+    max_file_size: Optional[int] = 16 * 1024 * 1024
+
+    @staticmethod
+    def is_supported() -> bool:
+        return resource is not None
+
+    def to_env(self) -> str:
+        return ",".join("" if value is None else str(value) for value in self)
+
+    @classmethod
+    def from_env(cls, value: str) -> "ResourceLimits":
+        return cls(*(int(field) if field else None for field in value.split(",")))
+
+    def apply(self):
+        for name, value in (
+            ("RLIMIT_AS", self.memory_bytes),
+            ("RLIMIT_NPROC", self.max_processes),
+            ("RLIMIT_NOFILE", self.max_open_files),
+            ("RLIMIT_FSIZE", self.max_file_size),
+        ):
+            if value is not None and hasattr(resource, name):
+                _lower_limit(getattr(resource, name), value, value)
+        if self.cpu_seconds is not None:
+            # SIGXCPU at the soft limit, SIGKILL one second later
+            _lower_limit(resource.RLIMIT_CPU, self.cpu_seconds, self.cpu_seconds + 1)
+
+
+def apply_env_limits():
+    """Applies (and removes, so the program doesn't see it) LIMITS_ENV, if set."""
+    value = os.environ.pop(LIMITS_ENV, None)
+    if value:
+        ResourceLimits.from_env(value).apply()
+
+
+def _lower_limit(which: int, soft: int, hard: int):
+    # Never try to raise a limit that is already lower
+    current_soft, current_hard = resource.getrlimit(which)
+    if current_hard != resource.RLIM_INFINITY:
+        hard = min(hard, current_hard)
+        soft = min(soft, hard)
+    resource.setrlimit(which, (soft, hard))
+
+
+class ResourceUsage(NamedTuple):
+    user_time: float
+    sys_time: float
+    # Peak RSS in bytes. Linux carries the launching process's footprint
+    # over exec into this value, so it is an upper bound for tiny programs.
+    max_rss: int
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.sys_time
+
+
+def rusage_values(usage) -> ResourceUsage:
+    """ResourceUsage from a struct_rusage (as returned by os.wait4)."""
+    max_rss = usage.ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024  # kilobytes everywhere but macOS
+    return ResourceUsage(usage.ru_utime, usage.ru_stime, max_rss)
+
+
+def classify_limit(returncode: Optional[int], stderr: str, limits: Optional[ResourceLimits]) -> Optional[str]:
+    """Which resource limit ended the program, if any."""
+    if limits is None or returncode is None or returncode == 0:
+        return None
+    if returncode == -signal.SIGXCPU:
+        return "CPU_LIMIT"
+    if returncode == -signal.SIGXFSZ:
+        return "OUTPUT_LIMIT"
+    if limits.memory_bytes is not None:
+        lines = stderr.strip().splitlines()
+        if lines and lines[-1].startswith("MemoryError"):
+            return "MEMORY_LIMIT"
+        if "Cannot allocate memory" in stderr or "out of memory" in stderr:
+            return "MEMORY_LIMIT"
+    return None
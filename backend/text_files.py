@@ -0,0 +1,101 @@
+import codecs
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+# Bytes looked at to tell cp932 and euc-jp apart
+SNIFF_BYTES = 64 * 1024
+
+
+class DecodedText(NamedTuple):
+    text: str
+    encoding: str
+    etag: str
+
+
+def make_etag(stat: os.stat_result) -> str:
+    # Changes whenever the file is rewritten; needs no read of the content
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _halfwidth_kana_ratio(text: str) -> float:
+    if not text:
+        return 0.0
+    return sum(1 for ch in text if "｡" <= ch <= "ﾟ") / len(text)
+
+
+def sniff_encoding(data: bytes) -> str:
+    """
+    Encoding of source text: a BOM wins, then strict utf-8, then cp932 or
+    euc-jp. EUC-JP bytes are mostly valid cp932 too (as half-width kana),
+    so when both decode the sample the one without kana soup is chosen.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    sample = data[:SNIFF_BYTES]
+    candidates = []
+    for encoding in ("cp932", "euc-jp"):
+        try:
+            # The sample may end in the middle of a character
+            text = codecs.getincrementaldecoder(encoding)().decode(sample, final=len(sample) == len(data))
+        except UnicodeDecodeError:
+            continue
+        candidates.append((_halfwidth_kana_ratio(text), encoding))
+    if not candidates:
+        return "cp932"
+    return min(candidates)[1]
+
+
+def decode_source(data: bytes) -> Tuple[str, str]:
+    """(text, encoding) of a source file read as bytes, with universal newlines."""
+    encoding = sniff_encoding(data)
+    text = data.decode(encoding, errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n"), encoding
+
+
+class TextFileCache:
+    """
+    Decoded contents of text files, keyed by (path, mtime, size) so a file
+    is read and decoded once per change. Least recently used entries are
+    dropped once the cached text exceeds max_chars.
+    """
+
+    def __init__(self, max_chars: int = 64 * 1024 * 1024):
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self.entries: "OrderedDict[tuple, DecodedText]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, filepath: str, stat: Optional[os.stat_result] = None) -> DecodedText:
+        if stat is None:
+            stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None:
+                self.entries.move_to_end(key)
+                return cached
+
+        with open(filepath, "rb") as f:
+            data = f.read()
+        text, encoding = decode_source(data)
+        decoded = DecodedText(text, encoding, make_etag(stat))
+
+        with self.lock:
+            # Older versions of the same file are never asked for again
+            for old_key in [k for k in self.entries if k[0] == filepath]:
+                self.total_chars -= len(self.entries.pop(old_key).text)
+            if len(text) <= self.max_chars:
+                self.entries[key] = decoded
+                self.total_chars += len(text)
+            while self.total_chars > self.max_chars:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_chars -= len(evicted.text)
+        return decoded
@@ -0,0 +1,225 @@
+"""
+Per-request span tracing in the Chrome trace event format, loadable in
+chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is off unless a request asks for it with an "X-Trace: 1" header
+or a "trace=1" query parameter. The request then gets a Trace in a context
+variable, span() records a complete ("X") event for every stage it wraps,
+and the finished trace is written to the trace directory. Its id is
+returned in the X-Trace-Id response header. Without an active trace, span()
+returns a shared no-op object, so the instrumentation costs one context
+variable lookup.
+
+Worker threads started by our own pools do not inherit context variables;
+wrap their targets with bind().
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+import anyio.to_thread
+
+# Trace files kept in the trace directory; older ones are deleted
+MAX_TRACE_FILES = 50
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("program_checker_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name: str = ""):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.created_at = time.time()
+        self.events: List[dict] = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, args: dict):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": "program_checker",
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": thread.native_id,
+            "args": args,
+        }
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.native_id] = thread.name
+
+    def to_json(self) -> dict:
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "program_checker backend"}}]
+        metadata += [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.trace_id, "request": self.name, "created_at": self.created_at},
+        }
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.trace_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f)
+        _prune(directory)
+        return path
+
+
+def _prune(directory: str):
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".json")]
+    except OSError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[MAX_TRACE_FILES:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def trace_path(directory: str, trace_id: str) -> Optional[str]:
+    """Path of a saved trace, None if there is none (or the id is malformed)."""
+    if not trace_id or any(c not in "0123456789abcdef" for c in trace_id):
+        return None
+    path = os.path.join(directory, f"{trace_id}.json")
+    return path if os.path.isfile(path) else None
+
+
+def list_traces(directory: str) -> List[dict]:
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".json")]
+    except OSError:
+        return []
+    traces = [
+        {"trace_id": entry.name[:-len(".json")], "created_at": entry.stat().st_mtime, "size": entry.stat().st_size}
+        for entry in entries
+    ]
+    traces.sort(key=lambda trace: trace["created_at"], reverse=True)
+    return traces
+
+
+class _Span:
+    __slots__ = ("trace", "name", "args", "start")
+
+    def __init__(self, trace: Trace, name: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        """Adds arguments known only inside the span (e.g. a status)."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **args):
+    """Context manager recording name as a span of the current trace, if any."""
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, args)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def bind(func):
+    """func, made to record into the current trace when called from another thread."""
+    trace = _current.get()
+    if trace is None:
+        return func
+
+    def traced(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return traced
+
+
+def _requested(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == b"x-trace":
+            return value.strip().lower() in (b"1", b"true", b"yes")
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("trace", [""])[-1].lower() in ("1", "true", "yes")
+
+
+class TracingMiddleware:
+    """ASGI middleware tracing the requests that ask for it into trace_dir."""
+
+    def __init__(self, app, trace_dir: str):
+        self.app = app
+        self.trace_dir = trace_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        state = {"response_start": None}
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                state["response_start"] = time.perf_counter()
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-trace-id", trace.trace_id.encode("ascii"))
+                ]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                if state["response_start"] is not None:
+                    trace.add("send_response", state["response_start"], time.perf_counter(), {})
+
+        token = _current.set(trace)
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            trace.add(trace.name, start_time, time.perf_counter(), {"route": route})
+            _current.reset(token)
+            await anyio.to_thread.run_sync(trace.save, self.trace_dir)
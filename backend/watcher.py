@@ -0,0 +1,277 @@
+"""
+Watch mode: regrades what changed in the work directory as soon as it
+changes.
+
+A watcher (make_watcher) reports which files in the directory were written,
+moved or deleted, through inotify on Linux and by polling mtimes/sizes
+everywhere else. WatchSession combines that with the test cases in the
+GradingStore: a changed .py file is regraded on all of its tests, an
+edited test case only on that test (every file when it is a common
+test). Results are pushed to SSE clients as they finish and each round
+is recorded as a "watch" run.
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Set
+
+from batch import BatchRunner
+from grading_store import GradingStore
+from jobs import EventLog
+
+WATCH_PATTERN = "*.py"
+# Quiet period after the last change before regrading, so an editor's
+# save (often several writes and a rename) triggers one round
+DEBOUNCE_SECONDS = 0.2
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    # Missing on very old C libraries
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+_libc = _load_libc()
+
+
+class PollingWatcher:
+    """Compares (mtime, size) of the watched files every interval seconds."""
+
+    backend = "polling"
+
+    def __init__(self, path: str, pattern: str = WATCH_PATTERN, interval: float = 1.0):
+        self.path = path
+        self.pattern = pattern
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, tuple]:
+        snapshot = {}
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if fnmatch.fnmatch(entry.name, self.pattern) and entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+        return snapshot
+
+    def wait(self, timeout: float) -> Set[str]:
+        """Names of files changed, added or removed, waiting up to timeout."""
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {
+            name for name in snapshot.keys() | self.snapshot.keys()
+            if snapshot.get(name) != self.snapshot.get(name)
+        }
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Kernel change notifications for one directory (Linux)."""
+
+    backend = "inotify"
+
+    def __init__(self, path: str, pattern: str = WATCH_PATTERN):
+        self.path = path
+        self.pattern = pattern
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+        if _libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch failed", path)
+
+    @staticmethod
+    def is_supported() -> bool:
+        return _libc is not None
+
+    def wait(self, timeout: float) -> Set[str]:
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; treat every watched file as changed
+                changed.update(
+                    entry for entry in os.listdir(self.path) if fnmatch.fnmatch(entry, self.pattern)
+                )
+            elif fnmatch.fnmatch(name, self.pattern):
+                changed.add(name)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(path: str, pattern: str = WATCH_PATTERN, interval: float = 1.0):
+    """inotify where available, polling otherwise."""
+    if InotifyWatcher.is_supported():
+        try:
+            return InotifyWatcher(path, pattern)
+        except OSError:
+            pass
+    return PollingWatcher(path, pattern, interval)
+
+
+def changed_tests(old: Dict[str, list], new: Dict[str, list]) -> Dict[str, Set[int]]:
+    """Indices of the test cases that were added or edited, per config key."""
+    changed = {}
+    for name, cases in new.items():
+        previous = old.get(name, [])
+        indices = {
+            i for i, tc in enumerate(cases)
+            if i >= len(previous) or previous[i] != tc
+        }
+        if indices:
+            changed[name] = indices
+    return changed
+
+
+class WatchSession(EventLog):
+    """
+    Watches one work directory in a background thread and regrades the
+    affected (file, test) pairs on every change. Events: "result" per
+    finished test, "removed" for deleted files, "round" after each regrade
+    and "done" once stopped.
+    """
+
+    def __init__(self, runner: BatchRunner, store: GradingStore, use_common: bool = False, interval: float = 1.0):
+        super().__init__(max_events=1000)
+        self.runner = runner
+        self.store = store
+        self.use_common = use_common
+        self.watcher = make_watcher(runner.work_dir, interval=interval)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.config = store.load()
+        self.rounds = 0
+        self.last_round = None
+
+    @property
+    def backend(self) -> str:
+        return self.watcher.backend
+
+    def start(self):
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self) -> dict:
+        return {
+            "work_dir": self.runner.work_dir,
+            "backend": self.backend,
+            "use_common": self.use_common,
+            "running": not self.stop_event.is_set(),
+            "rounds": self.rounds,
+            "last_round": self.last_round,
+        }
+
+    def _run(self):
+        try:
+            while not self.stop_event.is_set():
+                changed = self.watcher.wait(self.interval)
+                # Keep collecting until the directory has been quiet for a moment
+                while changed:
+                    more = self.watcher.wait(DEBOUNCE_SECONDS)
+                    if not more:
+                        break
+                    changed |= more
+                if not self.stop_event.is_set():
+                    self._regrade(changed)
+        except Exception as e:
+            self._emit({"type": "error", "error": str(e)})
+        finally:
+            self.watcher.close()
+            self.stop_event.set()
+            self._emit({"type": "done", "status": "stopped"})
+
+    def _regrade(self, changed_files: Set[str]):
+        # The test cases are re-read every tick; load() is cheap when nothing changed
+        config = self.store.load()
+        edited = changed_tests(self.config, config) if config is not self.config else {}
+        self.config = config
+
+        tests: Dict[str, Set[int]] = {}
+        for filename in changed_files:
+            if not os.path.exists(os.path.join(self.runner.work_dir, filename)):
+                self._emit({"type": "removed", "filename": filename})
+                continue
+            cases = config.get("__COMMON__" if self.use_common else filename, [])
+            tests[filename] = set(range(len(cases)))
+        if self.use_common:
+            if "__COMMON__" in edited:
+                for filename in self._watched_files():
+                    tests.setdefault(filename, set()).update(edited["__COMMON__"])
+        else:
+            for filename, indices in edited.items():
+                if filename != "__COMMON__" and os.path.exists(os.path.join(self.runner.work_dir, filename)):
+                    tests.setdefault(filename, set()).update(indices)
+        tests = {name: indices for name, indices in tests.items() if indices}
+        if not tests:
+            return
+
+        selection = {name: sorted(indices) for name, indices in tests.items()}
+        response = self.runner.run(
+            sorted(selection),
+            config,
+            use_common=self.use_common,
+            on_result=lambda filename, result: self._emit({"type": "result", "filename": filename, "result": result}),
+            tests=selection,
+        )
+        run_id = self.store.record_run("watch", response["batch_results"], self.use_common, response["stats"], config)
+        self.rounds += 1
+        self.last_round = {
+            "run_id": run_id,
+            "finished_at": time.time(),
+            "tests": selection,
+            "stats": response["stats"],
+        }
+        self._emit({"type": "round", **self.last_round, "batch_results": response["batch_results"]})
+
+    def _watched_files(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.runner.work_dir)
+            if fnmatch.fnmatch(name, WATCH_PATTERN)
+        )
@@ -25,6 +25,12 @@ interface BatchFileResult {
     output: string;
     error: string;
     diff?: string;
+    mismatch?: {
+      line: number;
+      expected: string | null;
+      actual: string | null;
+    } | null;
+    result_id?: number | null;
   }[];
 }
 
@@ -45,12 +51,14 @@ function App() {
   >({});
 
   // 複数テストケースの結果を1つのファイルステータスに集約する。
-  // 優先順位: FAIL/ERRORが1つでもあればFAIL、次にTIMEOUT、全てPASSならPASS。
+  // 優先順位: FAIL/ERROR/OUTPUT_LIMIT などの失敗が1つでもあればFAIL、
+  // 次にTIMEOUT、全てPASSならPASS。
   const aggregateStatus = (
     statuses: string[]
   ): "PASS" | "FAIL" | "TIMEOUT" | undefined => {
     if (statuses.length === 0) return undefined;
-    if (statuses.some((s) => s === "FAIL" || s === "ERROR")) return "FAIL";
+    const neutral = ["PASS", "TIMEOUT", "CANCELLED"];
+    if (statuses.some((s) => !neutral.includes(s))) return "FAIL";
     if (statuses.some((s) => s === "TIMEOUT")) return "TIMEOUT";
     if (statuses.every((s) => s === "PASS")) return "PASS";
     return undefined;
@@ -316,35 +324,161 @@ function App() {
     }
   };
 
+  // 一括実行の結果から、サイドバーのファイルステータスを更新する。
+  const applyBatchStatuses = (batchFileResults: BatchFileResult[]) => {
+    const newStatuses: Record<string, "PASS" | "FAIL" | "TIMEOUT"> = {};
+    for (const r of batchFileResults) {
+      if (r.results && r.results.length > 0) {
+        const agg = aggregateStatus(r.results.map((tr) => tr.status));
+        if (agg) newStatuses[r.filename] = agg;
+      }
+    }
+    setFileStatuses((prev) => ({ ...prev, ...newStatuses }));
+  };
+
+  // 一括実行はジョブとして投入し、Server-Sent Events で
+  // テストが1件終わるごとに結果を受け取って画面に反映する。
   const handleBatchRun = async () => {
     if (!files.length) return;
     setBatchRunning(true);
+    setBatchResults([]);
     try {
-      const res = await axios.post("http://localhost:8000/api/batch", {
+      const res = await axios.post("http://localhost:8000/api/jobs", {
         filenames: files,
         use_common: useCommonTests,
       });
-      const batchFileResults: BatchFileResult[] = res.data.batch_results;
-      setBatchResults(batchFileResults);
-
-      const newStatuses: Record<string, "PASS" | "FAIL" | "TIMEOUT"> = {};
-      for (const r of batchFileResults) {
-        if (r.results && r.results.length > 0) {
-          const agg = aggregateStatus(r.results.map((tr) => tr.status));
-          if (agg) newStatuses[r.filename] = agg;
+      const jobId: string = res.data.job_id;
+      const source = new EventSource(
+        `http://localhost:8000/api/jobs/${jobId}/events`
+      );
+
+      source.addEventListener("result", (e) => {
+        const { filename, result } = JSON.parse((e as MessageEvent).data);
+        setBatchResults((prev) => {
+          const existing = prev.find((r) => r.filename === filename);
+          const results = [...(existing?.results ?? []), result].sort(
+            (a, b) => a.test_case - b.test_case
+          );
+          const updated = { filename, results };
+          return existing
+            ? prev.map((r) => (r.filename === filename ? updated : r))
+            : [...prev, updated];
+        });
+      });
+
+      source.addEventListener("done", (e) => {
+        source.close();
+        const data = JSON.parse((e as MessageEvent).data);
+        const batchFileResults: BatchFileResult[] = data.batch_results;
+        setBatchResults(batchFileResults);
+        applyBatchStatuses(batchFileResults);
+        setBatchRunning(false);
+        if (data.status === "error") {
+          alert("一括実行に失敗しました。");
+        } else {
+          alert("一括実行が完了しました。");
         }
-      }
-      setFileStatuses((prev) => ({ ...prev, ...newStatuses }));
+      });
 
-      alert("一括実行が完了しました。");
+      source.onerror = () => {
+        // EventSource は自動で再接続する。閉じられた場合のみ失敗扱いにする。
+        if (source.readyState === EventSource.CLOSED) {
+          setBatchRunning(false);
+          alert("一括実行に失敗しました。");
+        }
+      };
     } catch (err) {
       console.error("Batch run failed", err);
       alert("一括実行に失敗しました。");
-    } finally {
       setBatchRunning(false);
     }
   };
 
+  // 自動再採点(ウォッチモード)。ファイルやテストケースが変更されると、
+  // サーバーが影響のあるテストだけを再採点し、結果を SSE で送ってくる。
+  const [watching, setWatching] = useState(false);
+  const watchSourceRef = useRef<EventSource | null>(null);
+
+  const closeWatchSource = () => {
+    watchSourceRef.current?.close();
+    watchSourceRef.current = null;
+    setWatching(false);
+  };
+
+  useEffect(() => {
+    // ディレクトリを切り替えたら前のディレクトリの監視結果は受け取らない
+    closeWatchSource();
+  }, [currentDir]);
+
+  useEffect(() => {
+    if (watching) applyBatchStatuses(batchResults);
+  }, [batchResults, watching]);
+
+  // fetchFiles と違い、選択中のファイルや結果はリセットしない
+  const refreshFileList = async () => {
+    try {
+      const res = await axios.get("http://localhost:8000/api/files?extension=py");
+      setFiles(res.data.files);
+    } catch (err) {
+      console.error("Failed to fetch files", err);
+    }
+  };
+
+  const toggleWatch = async () => {
+    if (watching) {
+      closeWatchSource();
+      try {
+        await axios.delete("http://localhost:8000/api/watch");
+      } catch (err) {
+        console.error("Failed to stop watch mode", err);
+      }
+      return;
+    }
+    try {
+      await axios.post("http://localhost:8000/api/watch", {
+        use_common: useCommonTests,
+      });
+      const source = new EventSource("http://localhost:8000/api/watch/events");
+      watchSourceRef.current = source;
+      setWatching(true);
+
+      source.addEventListener("result", (e) => {
+        const { filename, result } = JSON.parse((e as MessageEvent).data);
+        setBatchResults((prev) => {
+          const existing = prev.find((r) => r.filename === filename);
+          const results = [
+            ...(existing?.results ?? []).filter(
+              (r) => r.test_case !== result.test_case
+            ),
+            result,
+          ].sort((a, b) => a.test_case - b.test_case);
+          const updated = { filename, results };
+          return existing
+            ? prev.map((r) => (r.filename === filename ? updated : r))
+            : [...prev, updated];
+        });
+      });
+
+      source.addEventListener("round", () => {
+        // 新しく提出されたファイルを一覧に反映する
+        refreshFileList();
+      });
+
+      source.addEventListener("removed", (e) => {
+        const { filename } = JSON.parse((e as MessageEvent).data);
+        setBatchResults((prev) => prev.filter((r) => r.filename !== filename));
+        refreshFileList();
+      });
+
+      source.addEventListener("done", () => {
+        closeWatchSource();
+      });
+    } catch (err) {
+      console.error("Failed to start watch mode", err);
+      alert("自動再採点を開始できませんでした。");
+    }
+  };
+
   // Find result for selected file
   const currentBatchResult = batchResults.find(
     (r) => r.filename === selectedFile
@@ -463,6 +597,17 @@ function App() {
               >
                 {batchRunning ? "実行中..." : "全ファイル一括実行"}
               </button>
+              <button
+                onClick={toggleWatch}
+                title="ファイルやテストケースの変更を検知して、影響のあるテストだけを自動で再採点します"
+                className={`px-3 py-1 rounded text-sm font-bold whitespace-nowrap ${
+                  watching
+                    ? "bg-orange-600 hover:bg-orange-700 text-white"
+                    : "bg-gray-300 hover:bg-gray-400 dark:bg-[#3c3c3c] dark:hover:bg-[#4c4c4c]"
+                }`}
+              >
+                {watching ? "自動再採点を停止" : "自動再採点"}
+              </button>
             </div>
           )}
 
@@ -5,6 +5,40 @@ interface TestCase {
   input_data: string;
   expected_output: string;
   run_only?: boolean;
+  comparator?: {
+    type: string;
+    abs_tol?: number;
+    rel_tol?: number;
+  } | null;
+  benchmark?: {
+    repeats?: number;
+    warmup?: number;
+    reference?: string | null;
+    max_slowdown?: number;
+    metric?: string;
+  } | null;
+}
+
+interface Mismatch {
+  line: number;
+  expected: string | null;
+  actual: string | null;
+}
+
+interface ProfileReport {
+  partial: boolean;
+  functions: {
+    function: string;
+    file: string;
+    line: number;
+    calls: number;
+    self_time: number;
+    total_time: number;
+  }[];
+  memory: {
+    peak_bytes: number;
+    sites: { file: string; line: number; size: number; count: number }[];
+  } | null;
 }
 
 interface ExecutionResult {
@@ -15,6 +49,9 @@ interface ExecutionResult {
   execution_time: number;
   expected_output?: string;
   diff?: string;
+  mismatch?: Mismatch | null;
+  result_id?: number | null;
+  profile?: ProfileReport | null;
 }
 
 interface RunnerProps {
@@ -29,6 +66,8 @@ interface RunnerProps {
       output: string;
       error: string;
       diff?: string;
+      mismatch?: Mismatch | null;
+      result_id?: number | null;
     }[];
   };
   onResult?: (filename: string, results: ExecutionResult[]) => void;
@@ -62,6 +101,8 @@ const Runner: React.FC<RunnerProps> = ({
             error: r.error || "",
             execution_time: r.execution_time,
             diff: r.diff,
+            mismatch: r.mismatch,
+            result_id: r.result_id,
           };
         });
       }
@@ -76,7 +117,8 @@ const Runner: React.FC<RunnerProps> = ({
     }
   }, [filename]);
 
-  const runSingle = async (index: number, tc: TestCase) => {
+  // profile を指定すると cProfile / tracemalloc の結果も返る（結果と一緒にキャッシュされる）
+  const runSingle = async (index: number, tc: TestCase, profile = false) => {
     setLoading(true);
     try {
       const response = await axios.post<ExecutionResult>(
@@ -86,6 +128,9 @@ const Runner: React.FC<RunnerProps> = ({
           input_data: tc.input_data,
           expected_output: tc.expected_output,
           run_only: tc.run_only,
+          comparator: tc.comparator,
+          benchmark: tc.benchmark,
+          profile: profile ? { top: 10, memory: true } : null,
         }
       );
       const updated = { ...results, [index]: response.data };
@@ -99,24 +144,37 @@ const Runner: React.FC<RunnerProps> = ({
     }
   };
 
+  // Batch results only carry the first mismatch; the diff is fetched on demand
+  const loadDiff = async (index: number, resultId: number) => {
+    try {
+      const response = await axios.get<{ diff: string | null }>(
+        `http://localhost:8000/api/results/${resultId}/diff`
+      );
+      setResults((prev) => ({
+        ...prev,
+        [index]: { ...prev[index], diff: response.data.diff ?? "" },
+      }));
+    } catch (error) {
+      console.error("Error loading diff:", error);
+    }
+  };
+
+  // 全テストを1リクエストで送り、サーバー側で並列に実行する
   const runAll = async () => {
     setLoading(true);
     const newResults: { [key: number]: ExecutionResult } = {};
-    for (let i = 0; i < testCases.length; i++) {
-      try {
-        const response = await axios.post<ExecutionResult>(
-          "http://localhost:8000/api/grade",
-          {
-            filename: filename,
-            input_data: testCases[i].input_data,
-            expected_output: testCases[i].expected_output,
-            run_only: testCases[i].run_only,
-          }
-        );
-        newResults[i] = response.data;
-      } catch (error) {
-        console.error("Error running code:", error);
-      }
+    try {
+      const response = await axios.post<{
+        results: (ExecutionResult & { test_case: number })[];
+      }>("http://localhost:8000/api/grade/batch", {
+        filename: filename,
+        test_cases: testCases,
+      });
+      response.data.results.forEach((r) => {
+        newResults[r.test_case - 1] = { ...r, filename: filename };
+      });
+    } catch (error) {
+      console.error("Error running code:", error);
     }
     setResults(newResults);
     setLoading(false);
@@ -171,6 +229,13 @@ const Runner: React.FC<RunnerProps> = ({
                   >
                     実行
                   </button>
+                  <button
+                    onClick={() => runSingle(index, tc, true)}
+                    disabled={loading}
+                    className="text-blue-600 dark:text-blue-400 hover:underline text-sm"
+                  >
+                    プロファイル
+                  </button>
                 </div>
               </div>
 
@@ -190,6 +255,25 @@ const Runner: React.FC<RunnerProps> = ({
                           {res.output}
                         </div>
                       </div>
+                      {!res.diff && res.mismatch && (
+                        <div className="mt-2">
+                          <span className="text-gray-500 dark:text-gray-400">
+                            {res.mismatch.line} 行目が不一致:
+                          </span>
+                          <div className="text-red-600 dark:text-red-400 pl-2">
+                            期待: {res.mismatch.expected ?? "(なし)"} / 実際:{" "}
+                            {res.mismatch.actual ?? "(なし)"}
+                          </div>
+                          {res.result_id != null && (
+                            <button
+                              onClick={() => loadDiff(index, res.result_id!)}
+                              className="text-blue-600 dark:text-blue-400 hover:underline text-xs"
+                            >
+                              差分を表示
+                            </button>
+                          )}
+                        </div>
+                      )}
                       {res.diff && (
                         <div className="mt-2">
                           <span className="text-gray-500 dark:text-gray-400">
@@ -205,6 +289,48 @@ const Runner: React.FC<RunnerProps> = ({
                       </div>
                     </>
                   )}
+                  {res.profile && (
+                    <div className="mt-2 text-xs">
+                      <div className="text-gray-500 dark:text-gray-400">
+                        プロファイル（自身の実行時間順）
+                        {res.profile.partial && "・タイムアウト前までの集計"}:
+                      </div>
+                      <table className="w-full">
+                        <tbody>
+                          {res.profile.functions.map((f, i) => (
+                            <tr key={i}>
+                              <td className="pr-2">
+                                {f.function} ({f.file}:{f.line})
+                              </td>
+                              <td className="pr-2 text-right">{f.calls} 回</td>
+                              <td className="pr-2 text-right">
+                                {f.self_time.toFixed(4)}s
+                              </td>
+                              <td className="text-right text-gray-400 dark:text-gray-500">
+                                累計 {f.total_time.toFixed(4)}s
+                              </td>
+                            </tr>
+                          ))}
+                        </tbody>
+                      </table>
+                      {res.profile.memory && (
+                        <div className="mt-1">
+                          <div className="text-gray-500 dark:text-gray-400">
+                            メモリ（ピーク{" "}
+                            {(res.profile.memory.peak_bytes / 1024).toFixed(0)}{" "}
+                            KiB）:
+                          </div>
+                          {res.profile.memory.sites.map((site, i) => (
+                            <div key={i} className="pl-2">
+                              {site.file}:{site.line} —{" "}
+                              {(site.size / 1024).toFixed(1)} KiB（{site.count}{" "}
+                              個）
+                            </div>
+                          ))}
+                        </div>
+                      )}
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -49,7 +49,21 @@ const Sidebar: React.FC<SidebarProps> = ({
             }`}
             onClick={() => onSelectFile(file)}
           >
-            <span className="truncate">{file}</span>
+            <span className="flex items-center gap-2 min-w-0">
+              {viewMode === "doc" && file.toLowerCase().endsWith(".pdf") && (
+                // 1ページ目のサムネイル(サーバー側でキャッシュ)。生成できない環境では非表示
+                <img
+                  src={`http://localhost:8000/api/pdf-thumbnails/${file}?width=64`}
+                  alt=""
+                  loading="lazy"
+                  className="w-8 flex-shrink-0 border border-gray-300 dark:border-[#3c3c3c] bg-white"
+                  onError={(e) => {
+                    e.currentTarget.style.display = "none";
+                  }}
+                />
+              )}
+              <span className="truncate">{file}</span>
+            </span>
             {fileStatuses[file] && (
               <span
                 title={fileStatuses[file]}
@@ -4,8 +4,22 @@ interface TestCase {
   input_data: string;
   expected_output: string;
   run_only?: boolean;
+  comparator?: {
+    type: string;
+    abs_tol?: number;
+    rel_tol?: number;
+  } | null;
 }
 
+// 出力の比較方法 (backend/comparators.py)
+const COMPARATORS: { value: string; label: string }[] = [
+  { value: "exact", label: "完全一致" },
+  { value: "tokens", label: "空白区切りトークン" },
+  { value: "float", label: "数値 (誤差許容)" },
+  { value: "regex", label: "正規表現" },
+  { value: "unordered_lines", label: "行の順不同" },
+];
+
 interface TestManagerProps {
   testCases: TestCase[];
   onUpdate: (testCases: TestCase[]) => void;
@@ -43,6 +57,16 @@ const TestManager: React.FC<TestManagerProps> = ({
     onUpdate(newCases);
   };
 
+  const handleComparatorChange = (index: number, type: string) => {
+    const newCases = [...localTestCases];
+    newCases[index] = {
+      ...newCases[index],
+      comparator: type === "exact" ? null : { type },
+    };
+    setLocalTestCases(newCases);
+    onUpdate(newCases);
+  };
+
   const handleDelete = (index: number) => {
     const newCases = localTestCases.filter((_, i) => i !== index);
     setLocalTestCases(newCases);
@@ -88,6 +112,18 @@ const TestManager: React.FC<TestManagerProps> = ({
                 <label className="block text-xs font-bold text-gray-600 dark:text-gray-400">
                   期待される出力 (標準出力)
                 </label>
+                <select
+                  className="text-xs border border-gray-300 dark:border-[#3c3c3c] rounded bg-white dark:bg-[#1e1e1e] text-gray-600 dark:text-gray-400"
+                  value={tc.comparator?.type ?? "exact"}
+                  onChange={(e) => handleComparatorChange(index, e.target.value)}
+                  disabled={tc.run_only}
+                >
+                  {COMPARATORS.map((c) => (
+                    <option key={c.value} value={c.value}>
+                      {c.label}
+                    </option>
+                  ))}
+                </select>
                 <label className="flex items-center gap-1 text-xs cursor-pointer text-gray-600 dark:text-gray-400">
                   <input
                     type="checkbox"
@@ -17,6 +17,12 @@ interface BatchResult {
     output: string;
     error: string;
     diff?: string;
+    mismatch?: {
+      line: number;
+      expected: string | null;
+      actual: string | null;
+    } | null;
+    result_id?: number | null;
   }[];
 }
 
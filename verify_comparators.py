@@ -0,0 +1,102 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from comparators import compare
+
+
+def check(name, expected, actual, config, want):
+    got = compare(expected, actual, config)
+    if want is None:
+        ok = got is None
+    else:
+        ok = got is not None and all(got.get(key) == value for key, value in want.items())
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {got}")
+    assert ok, f"{name}: expected {want}, got {got}"
+
+
+def test_exact():
+    print("Testing exact comparison...")
+    check("identical", "a\nb", "a\nb", None, None)
+    check("CRLF equals LF", "a\nb", "a\r\nb\r\n", None, None)
+    check("CRLF in expected only", "a\r\nb\r\nc", "a\nb\nd", None, {"line": 3, "expected": "c", "actual": "d"})
+    check("surrounding whitespace", "  a\nb \n\n", "a\nb", None, None)
+    check("inner trailing space counts", "a \nb", "a\nb", None, {"line": 1, "expected": "a ", "actual": "a"})
+    check("changed line", "a\nb\nc", "a\nx\nc", None, {"line": 2, "expected": "b", "actual": "x"})
+    check("extra line", "a\nb", "a\nb\nc", None, {"line": 3, "expected": None, "actual": "c"})
+    check("missing line", "a\nb\nc", "a\nb", None, {"line": 3, "expected": "c", "actual": None})
+    check("both empty", "", "\n", None, None)
+    check("empty expected", "", "x", None, {"line": 1, "expected": None, "actual": "x"})
+    check("type None is exact", "a", "a ", {"type": None}, None)
+
+    # Differences past the 64 KiB comparison chunks
+    long_line = "x" * 100000
+    check("long line", long_line + "a", long_line + "b", None, {"line": 1})
+    lines = [f"line {i:05d}" for i in range(20000)]
+    changed = list(lines)
+    changed[15000] = "changed"
+    check("many lines", "\n".join(lines), "\n".join(changed), None,
+          {"line": 15001, "expected": "line 15000", "actual": "changed"})
+    check("many lines CRLF", "\n".join(lines), "\r\n".join(lines), None, None)
+
+
+def test_tokens():
+    print("Testing tokens comparison...")
+    tokens = {"type": "tokens"}
+    check("layout ignored", "1 2\n3", "1\n2   3\n", tokens, None)
+    check("missing token", "1 2 3", "1 2", tokens, {"expected": "3", "actual": None, "detail": "token 3"})
+    check("extra token", "1 2", "1 2 3", tokens, {"expected": None, "actual": "3", "detail": "token 3"})
+    check("different token", "1 2 3", "1\n5 3", tokens, {"line": 2, "expected": "2", "actual": "5"})
+
+
+def test_float():
+    print("Testing float comparison...")
+    check("default tolerance", "0.1 2", "0.10000001 2.0", {"type": "float"}, None)
+    check("outside tolerance", "1.0", "1.1", {"type": "float"}, {"expected": "1.0", "actual": "1.1"})
+    check("abs_tol", "1.0", "1.1", {"type": "float", "abs_tol": 0.2}, None)
+    check("rel_tol", "100", "101", {"type": "float", "abs_tol": 0, "rel_tol": 0.02}, None)
+    check("zero tolerance is not the default", "1.0", "1.0000001", {"type": "float", "abs_tol": 0, "rel_tol": 0}, {"line": 1})
+    check("words compare exactly", "result: 1.0", "Result: 1.0", {"type": "float"}, {"expected": "result:"})
+    check("nan only equals itself as text", "nan", "nan", {"type": "float"}, None)
+    check("nan is not a number", "1.0", "nan", {"type": "float", "abs_tol": 1e9}, {"actual": "nan"})
+
+
+def test_regex():
+    print("Testing regex comparison...")
+    check("full match", r"\d+ items", "12 items\n", {"type": "regex"}, None)
+    check("partial match fails", r"\d+ items", "12 items extra", {"type": "regex"},
+          {"detail": "output does not match the regular expression"})
+    got = compare("(", "anything", {"type": "regex"})
+    print(f"OK   invalid pattern: {got}")
+    assert got is not None and got["detail"].startswith("invalid regular expression")
+
+
+def test_unordered_lines():
+    print("Testing unordered_lines comparison...")
+    unordered = {"type": "unordered_lines"}
+    check("reordered", "a\nb\nb", "b\na\nb", unordered, None)
+    check("CRLF", "a\nb", "b\r\na\r\n", unordered, None)
+    check("unexpected line", "a\nb", "a\nc", unordered, {"line": 2, "actual": "c", "detail": "unexpected line"})
+    check("missing line", "a\nb", "a", unordered, {"expected": "b", "detail": "missing line"})
+    check("duplicate counted", "a\nb", "a\na", unordered, {"actual": "a", "detail": "unexpected line"})
+
+
+def test_unknown():
+    print("Testing unknown comparator...")
+    try:
+        compare("a", "a", {"type": "nope"})
+    except ValueError as e:
+        print(f"OK   unknown comparator: {e}")
+    else:
+        raise AssertionError("unknown comparator accepted")
+
+
+if __name__ == "__main__":
+    test_exact()
+    test_tokens()
+    test_float()
+    test_regex()
+    test_unordered_lines()
+    test_unknown()
+    print("All comparator checks passed!")
@@ -0,0 +1,115 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from distributed import DistributedBatchRunner, QueueWorker, TaskQueue
+from executor import Executor
+
+
+def test_round_trip(queue: TaskQueue):
+    print("Testing submit / claim / complete / collect...")
+    ids = queue.submit("batch-1", [{"n": 1}, {"n": 2}, {"n": 3}])
+    queue.submit("batch-2", [{"n": 4}])
+    assert queue.pending_count() == 4
+
+    queue.heartbeat("worker-a", 1)
+    claimed = [queue.claim("worker-a") for _ in range(3)]
+    print(f"Claimed: {claimed}")
+    assert [task_id for task_id, _ in claimed] == ids, "tasks are claimed oldest first"
+    assert [payload["n"] for _, payload in claimed] == [1, 2, 3]
+    assert queue.pending_count() == 1
+
+    for task_id, payload in claimed[:2]:
+        queue.complete(task_id, "worker-a", {"n": payload["n"] * 10}, 0.5)
+    collected = queue.collect("batch-1")
+    print(f"Collected: {collected}")
+    assert sorted((task_id, result["n"]) for task_id, result, _, _ in collected) == [(ids[0], 10), (ids[1], 20)]
+    assert all(worker_id == "worker-a" and busy_time == 0.5 for _, _, worker_id, busy_time in collected)
+    assert queue.collect("batch-1") == [], "collected tasks are removed"
+
+    worker = queue.workers()[0]
+    print(f"Worker: {worker}")
+    assert worker["worker_id"] == "worker-a" and worker["tasks_done"] == 2
+
+    # The unclaimed task of batch-2 is cancelled, the claimed one of batch-1 is not
+    assert len(queue.cancel("batch-2")) == 1
+    assert queue.cancel("batch-1") == []
+    assert queue.pending_count() == 0
+    queue.drop("batch-1")
+    queue.unregister("worker-a")
+    assert queue.workers() == []
+
+
+def test_stale_worker(queue: TaskQueue):
+    print("Testing requeue of a stale worker's task...")
+    [task_id] = queue.submit("batch-3", [{"n": 5}])
+    queue.heartbeat("worker-stale", 1)
+    assert queue.claim("worker-stale")[0] == task_id
+    assert queue.requeue_stale(stale_after=10) == 0, "a live worker keeps its task"
+
+    time.sleep(0.3)
+    queue.heartbeat("worker-live", 1)
+    requeued = queue.requeue_stale(stale_after=0.2)
+    print(f"Requeued: {requeued}")
+    assert requeued == 1 and queue.pending_count() == 1
+    assert queue.claim("worker-live")[0] == task_id
+
+    # The stale worker finishing late does not overwrite the new owner's result
+    queue.complete(task_id, "worker-stale", {"from": "stale"}, 1.0)
+    assert queue.collect("batch-3") == []
+    queue.complete(task_id, "worker-live", {"from": "live"}, 1.0)
+    collected = queue.collect("batch-3")
+    print(f"Collected: {collected}")
+    assert [(result["from"], worker_id) for _, result, worker_id, _ in collected] == [("live", "worker-live")]
+    queue.unregister("worker-stale")
+    queue.unregister("worker-live")
+
+
+def test_workers_grade_batch(queue: TaskQueue, work_dir: str):
+    print("Testing a batch graded by a queue worker...")
+    with open(os.path.join(work_dir, "double.py"), "w") as f:
+        f.write("print(int(input()) * 2)\n")
+    with open(os.path.join(work_dir, "deleted.py"), "w") as f:
+        f.write("print(1)\n")
+    executor = Executor(timeout=5)
+    worker = QueueWorker(queue, {True: executor, False: executor}, threads=2, worker_id="worker-grade")
+    thread = threading.Thread(target=worker.serve, kwargs={"report_every": 0}, daemon=True)
+    thread.start()
+
+    runner = DistributedBatchRunner(work_dir, executor, queue)
+    execute = runner.execute
+
+    def execute_after_delete(tasks, cancel_event):
+        # Gone after submit: the worker must still complete the task
+        os.remove(os.path.join(work_dir, "deleted.py"))
+        return execute(tasks, cancel_event)
+
+    runner.execute = execute_after_delete
+    config = {
+        "double.py": [{"input_data": "2", "expected_output": "4"}, {"input_data": "5", "expected_output": "11"}],
+        "deleted.py": [{"input_data": "", "expected_output": "1"}],
+    }
+    response = runner.run(["double.py", "deleted.py"], config)
+    statuses = {entry["filename"]: [r["status"] for r in entry["results"]] for entry in response["batch_results"]}
+    print(f"Statuses: {statuses}, worker tasks: {response['stats']['worker_tasks']}")
+    assert statuses == {"double.py": ["PASS", "FAIL"], "deleted.py": ["ERROR"]}
+    assert response["stats"]["worker_tasks"]["worker-grade"]["tasks"] == 3
+    assert thread.is_alive(), "the worker survives a failing task"
+    worker.stop()
+    thread.join()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = TaskQueue(os.path.join(tmp, "queue.sqlite3"))
+        test_round_trip(queue)
+        test_stale_worker(queue)
+        work_dir = os.path.join(tmp, "work")
+        os.makedirs(work_dir)
+        test_workers_grade_batch(queue, work_dir)
+        queue.close()
+    print("All task queue checks passed!")